@@ -1,6 +1,10 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from . import models, schemas
+from .services import catalog_index, ann_index, profiles, rec_cache, tag_index, facet_index, similar_books
 from typing import List, Optional
+from datetime import datetime
+import numpy as np
 
 # --- Books ---
 def get_book(db: Session, book_id: int):
@@ -18,17 +22,97 @@ def get_books_count(db: Session, q: Optional[str] = None):
         query = query.filter(models.Book.title.contains(q) | models.Book.author.contains(q))
     return query.count()
 
+def get_books_by_ids(db: Session, book_ids: List[int]):
+    if not book_ids:
+        return []
+    return db.query(models.Book).filter(models.Book.id.in_(book_ids)).all()
+
+def get_book_by_content_hash(db: Session, content_hash: str):
+    return db.query(models.Book).filter(models.Book.content_hash == content_hash).first()
+
 def create_book(db: Session, book: schemas.BookCreate):
     db_book = models.Book(**book.dict())
     db.add(db_book)
     db.commit()
     db.refresh(db_book)
+    catalog_index.add_book(db_book)
+    ann_index.add_book(db_book.id)
+    tag_index.add_book(db, db_book)
+    facet_index.add_book(db, db_book)
+    similar_books.add_book(db, db_book.id)
+    rec_cache.bump_catalog()
     return db_book
 
+def get_similar_books(db: Session, book_id: int, k: int = 10):
+    """(Book, score) pairs from the precomputed neighbour table, most similar first."""
+    return (
+        db.query(models.Book, models.BookNeighbor.score)
+        .join(models.BookNeighbor, models.BookNeighbor.neighbor_id == models.Book.id)
+        .filter(models.BookNeighbor.book_id == book_id)
+        .order_by(models.BookNeighbor.score.desc())
+        .limit(k)
+        .all()
+    )
+
+# --- Analysis Jobs ---
+def get_analysis_job(db: Session, job_id: str):
+    return db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job_id).first()
+
+def get_active_analysis_job_by_hash(db: Session, content_hash: str, updated_after: Optional[datetime] = None):
+    """A queued or running job for the same file (updated since `updated_after`), if any."""
+    query = (
+        db.query(models.AnalysisJob)
+        .filter(models.AnalysisJob.content_hash == content_hash)
+        .filter(models.AnalysisJob.status.in_(["queued", "running"]))
+    )
+    if updated_after is not None:
+        query = query.filter(models.AnalysisJob.updated_at >= updated_after)
+    return query.order_by(models.AnalysisJob.created_at).first()
+
+def fail_stale_analysis_jobs(db: Session, updated_before: datetime, error: str) -> int:
+    """Marks queued/running jobs not updated since `updated_before` as failed. Returns how many."""
+    count = (
+        db.query(models.AnalysisJob)
+        .filter(models.AnalysisJob.status.in_(["queued", "running"]))
+        .filter(models.AnalysisJob.updated_at < updated_before)
+        .update({models.AnalysisJob.status: "failed", models.AnalysisJob.error: error}, synchronize_session=False)
+    )
+    db.commit()
+    return count
+
+def create_analysis_job(db: Session, job_id: str, title: str, author: Optional[str], file_path: str, stages: List[str],
+                        content_hash: Optional[str] = None, book_id: Optional[int] = None):
+    """Queued job; with book_id (duplicate upload) it is created already succeeded and all stages skipped."""
+    db_job = models.AnalysisJob(
+        id=job_id,
+        status="queued" if book_id is None else "succeeded",
+        title=title,
+        author=author,
+        file_path=file_path,
+        content_hash=content_hash,
+        book_id=book_id,
+        stages={stage: {"status": "pending" if book_id is None else "skipped"} for stage in stages},
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
 # --- Users ---
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
+def get_shelf_version(db: Session, user_id: int) -> int:
+    version = db.query(models.User.shelf_version).filter(models.User.id == user_id).scalar()
+    return version or 0
+
+def _bump_shelf_version(db: Session, user_id: int):
+    """Increments the user's shelf version in the caller's transaction (visible to every worker)."""
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.shelf_version: func.coalesce(models.User.shelf_version, 0) + 1},
+        synchronize_session=False,
+    )
+
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
@@ -49,8 +133,26 @@ def get_user_books(db: Session, user_id: int, status: Optional[str] = None):
         query = query.filter(models.UserBook.status == status)
     return query.all()
 
+def get_user_book_ids(db: Session, user_id: int) -> List[int]:
+    rows = db.query(models.UserBook.book_id).filter(models.UserBook.user_id == user_id).all()
+    return [book_id for (book_id,) in rows]
+
+def get_user_book_signals(db: Session, user_ids: List[int]):
+    """(user_id, book_id, rating, status, last_read_at) rows used to weight profiles, without loading books."""
+    if not user_ids:
+        return []
+    return db.query(
+        models.UserBook.user_id,
+        models.UserBook.book_id,
+        models.UserBook.rating,
+        models.UserBook.status,
+        models.UserBook.last_read_at,
+    ).filter(models.UserBook.user_id.in_(user_ids)).all()
+
 def create_or_update_user_book(db: Session, user_id: int, book_id: int, user_book: schemas.UserBookCreate):
     db_user_book = get_user_book(db, user_id, book_id)
+    old_weight = profiles.book_weight(db_user_book)
+    is_new = db_user_book is None
     if db_user_book:
         # Update
         for key, value in user_book.dict(exclude_unset=True).items():
@@ -59,7 +161,67 @@ def create_or_update_user_book(db: Session, user_id: int, book_id: int, user_boo
         # Create
         db_user_book = models.UserBook(user_id=user_id, book_id=book_id, **user_book.dict())
         db.add(db_user_book)
+
+    new_weight = profiles.book_weight(db_user_book)
+    update_user_profile(db, user_id, book_id, old_weight, new_weight, added=is_new)
+    _bump_shelf_version(db, user_id)
     
     db.commit()
     db.refresh(db_user_book)
     return db_user_book
+
+# --- UserProfiles ---
+def get_user_profile(db: Session, user_id: int):
+    return db.query(models.UserProfile).filter(models.UserProfile.user_id == user_id).first()
+
+def rebuild_user_profile(db: Session, user_id: int):
+    """Recomputes the profile from the user's whole shelf (new users, or after a weighting change)."""
+    rows = (
+        db.query(models.UserBook.rating, models.UserBook.status, models.Book.embedding)
+        .join(models.Book, models.Book.id == models.UserBook.book_id)
+        .filter(models.UserBook.user_id == user_id)
+        .all()
+    )
+    rows = [(row, profiles.book_vector(row.embedding)) for row in rows]
+    rows = [(row, vector) for row, vector in rows if vector is not None]
+    weights = profiles.compute_weights([r.rating for r, _ in rows], [r.status for r, _ in rows])
+    vector_sum = None
+    if rows:
+        # Books of different dimensions are summed on their shared prefix
+        dim = min(len(vector) for _, vector in rows)
+        vectors = np.stack([vector[:dim] for _, vector in rows])
+        vector_sum = (weights @ vectors).astype(np.float32)
+
+    db_profile = get_user_profile(db, user_id)
+    if db_profile is None:
+        db_profile = models.UserProfile(user_id=user_id)
+        db.add(db_profile)
+    db_profile.vector_sum = vector_sum
+    db_profile.weight_sum = float(np.abs(weights).sum())
+    db_profile.book_count = len(rows)
+    db_profile.scheme = profiles.scheme()
+    return db_profile
+
+def update_user_profile(db: Session, user_id: int, book_id: int, old_weight: float, new_weight: float, added: bool = False):
+    """Applies one shelf change to the stored profile in O(d). Caller commits."""
+    db_profile = get_user_profile(db, user_id)
+    if db_profile is None or db_profile.scheme != profiles.scheme():
+        db.flush()
+        return rebuild_user_profile(db, user_id)
+
+    vector = profiles.book_vector(db.query(models.Book.embedding).filter(models.Book.id == book_id).scalar())
+    if vector is None:
+        return db_profile
+    if added:
+        db_profile.book_count = (db_profile.book_count or 0) + 1
+    if new_weight != old_weight:
+        db_profile.vector_sum = profiles.apply_delta(db_profile.vector_sum, vector, new_weight - old_weight)
+        db_profile.weight_sum = (db_profile.weight_sum or 0.0) + abs(new_weight) - abs(old_weight)
+    return db_profile
+
+def get_or_build_user_profile(db: Session, user_id: int):
+    db_profile = get_user_profile(db, user_id)
+    if db_profile is None or db_profile.scheme != profiles.scheme():
+        db_profile = rebuild_user_profile(db, user_id)
+        db.commit()
+    return db_profile
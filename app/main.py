@@ -1,15 +1,21 @@
 from fastapi import FastAPI
-from . import models
+from . import models, migrations
 from .database import engine
-from .routers import books, users, recommendations
+from .routers import books, users, recommendations, jobs
+from .services import jobs as analysis_jobs
 
 models.Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
+analysis_jobs.fail_orphaned_jobs()
 
 app = FastAPI(title="Book Recommendation Server")
 
+app.add_middleware(books.UploadSizeLimit)
+
 app.include_router(books.router)
 app.include_router(users.router)
 app.include_router(recommendations.router)
+app.include_router(jobs.router)
 
 @app.get("/")
 def read_root():
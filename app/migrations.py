@@ -0,0 +1,89 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+
+def migrate_embeddings_to_blob(engine: Engine, batch_size: int = 500) -> int:
+    """
+    Converts books.embedding values still stored as JSON text into packed float32 BLOBs.
+    JSON 'null' (how the old JSON column stored a missing embedding) becomes SQL NULL.
+    Idempotent: rows that are already BLOBs are left untouched.
+    """
+    from .models import parse_vector
+
+    converted = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(
+                text("SELECT id, embedding FROM books WHERE typeof(embedding) = 'text' LIMIT :n"),
+                {"n": batch_size},
+            ).fetchall()
+            if not rows:
+                break
+            for book_id, raw in rows:
+                try:
+                    vector = parse_vector(raw)
+                    packed = None if vector is None else vector.tobytes()
+                except (ValueError, TypeError) as e:
+                    print(f"[WARNING] Book {book_id}: unreadable embedding, clearing it ({e})")
+                    packed = None
+                conn.execute(
+                    text("UPDATE books SET embedding = :emb WHERE id = :id"),
+                    {"emb": packed, "id": book_id},
+                )
+            converted += len(rows)
+    return converted
+
+
+def add_missing_columns(engine: Engine) -> list:
+    """
+    ALTER TABLE ... ADD COLUMN for model columns missing from existing tables
+    (create_all only creates whole tables). Returns the added "table.column" names.
+    """
+    from .models import Base
+
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table.name})"))}
+            if not existing:
+                continue  # Table not created yet
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_missing_indexes(engine: Engine) -> list:
+    """Creates model indexes missing from existing tables (e.g. on columns added above)."""
+    from .models import Base
+
+    created = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {row[1] for row in conn.execute(text(f"PRAGMA index_list({table.name})"))}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn, checkfirst=True)
+                    created.append(index.name)
+    return created
+
+
+def upgrade(engine: Engine):
+    """Brings an existing books.db up to the current schema/storage format."""
+    if engine.dialect.name != "sqlite":
+        return
+    for name in add_missing_columns(engine):
+        print(f"✅ Added column {name}.")
+    for name in create_missing_indexes(engine):
+        print(f"✅ Created index {name}.")
+    converted = migrate_embeddings_to_blob(engine)
+    if converted:
+        print(f"✅ Migrated {converted} book embeddings from JSON to float32 BLOB.")
+
+
+if __name__ == "__main__":
+    from .database import engine
+    upgrade(engine)
@@ -1,8 +1,58 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON
+import json
+import numpy as np
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 from .database import Base
 
+def parse_vector(value):
+    """
+    1-D float32 array from a list/array or legacy JSON text; None for None / 'null'.
+    Raises ValueError for anything that isn't a flat vector.
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+    if value is None:
+        return None
+    vector = np.asarray(value, dtype="<f4")
+    if vector.ndim != 1:
+        raise ValueError(f"Embedding must be a 1-D vector, got shape {vector.shape}")
+    return vector
+
+class Float32Vector(TypeDecorator):
+    """
+    Stores a vector as packed little-endian float32 bytes and returns it as a NumPy array.
+    Rows still holding the legacy JSON text are decoded too (see app/migrations.py).
+    """
+    impl = LargeBinary
+    cache_ok = True
+    hashable = False  # NumPy arrays can't be hashed when the ORM uniques mixed rows
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return bytes(value)
+        vector = parse_vector(value)
+        return None if vector is None else vector.tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            try:
+                return parse_vector(value)
+            except (ValueError, TypeError):
+                return None  # Unreadable legacy text; the migration clears these
+        return np.frombuffer(value, dtype="<f4")
+
+    def compare_values(self, x, y):
+        # The ORM's change check uses ==, which is elementwise (and raises on a length change) for arrays
+        if x is None or y is None:
+            return x is y
+        return np.array_equal(np.asarray(x), np.asarray(y))
+
 class User(Base):
     __tablename__ = "users"
 
@@ -10,8 +60,10 @@ class User(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    shelf_version = Column(Integer, default=0) # Bumped with every shelf write; rec_cache validates against it
 
     books = relationship("UserBook", back_populates="user")
+    profile = relationship("UserProfile", back_populates="user", uselist=False)
 
 class Book(Base):
     __tablename__ = "books"
@@ -21,12 +73,39 @@ class Book(Base):
     author = Column(String)
     description = Column(Text)
     published_year = Column(Integer)
-    embedding = Column(JSON) # Storing as JSON for SQLite compatibility
+    embedding = Column(Float32Vector) # Packed float32 BLOB
     tags = Column(JSON)      # Storing as JSON
+    content_hash = Column(String, unique=True, index=True) # SHA-256 of the analysed EPUB file
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user_books = relationship("UserBook", back_populates="book")
 
+class BookNeighbor(Base):
+    __tablename__ = "book_neighbors"
+
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    neighbor_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    score = Column(Float, nullable=False) # Cosine similarity
+
+    # /books/{id}/similar reads one book's best neighbours straight off this index
+    __table_args__ = (Index("ix_book_neighbors_book_score", "book_id", "score"),)
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String, primary_key=True) # uuid4
+    status = Column(String, default="queued") # queued, running, succeeded, failed
+    stage = Column(String) # Current stage (convert, split, tag, aggregate, embed)
+    stages = Column(JSON) # {stage: {"status", "started_at", "finished_at", "detail"}}
+    title = Column(String, nullable=False)
+    author = Column(String)
+    file_path = Column(String)
+    content_hash = Column(String, index=True) # SHA-256 of the uploaded file
+    book_id = Column(Integer, ForeignKey("books.id")) # Set once the book row is written
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class UserBook(Base):
     __tablename__ = "user_books"
 
@@ -39,3 +118,15 @@ class UserBook(Base):
 
     user = relationship("User", back_populates="books")
     book = relationship("Book", back_populates="user_books")
+
+class UserProfile(Base):
+    __tablename__ = "user_profiles"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    vector_sum = Column(Float32Vector) # Running weighted sum of book embeddings
+    weight_sum = Column(Float, default=0.0)
+    book_count = Column(Integer, default=0)
+    scheme = Column(String) # profiles.scheme() the sums were built with
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    user = relationship("User", back_populates="profile")
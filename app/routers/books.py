@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import shutil
+import hashlib
 import os
 import uuid
+import zipfile
 
 from .. import crud, models, schemas
 from ..database import get_db
-from ..services import analysis
+from ..services import analysis, jobs, similar_books
 
 router = APIRouter(
     prefix="/books",
@@ -16,41 +19,165 @@ router = APIRouter(
 
 UPLOAD_DIR = "storage/epubs"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024)
+EPUB_MIMETYPE = b"application/epub+zip"
+ZIP_MAGIC = b"PK\x03\x04"
 
-@router.post("/upload", response_model=schemas.Book)
+# What an upload of an already analysed file (same SHA-256) does:
+#  - "existing": no new book; the returned job points at the existing one
+#  - "reuse": new book with this upload's title/author and the existing tags/embedding
+DUPLICATE_MODES = ["existing", "reuse"]
+
+class UploadSizeLimit:
+    """
+    ASGI middleware (registered in main) capping the /books/upload request body.
+    A declared Content-Length over the cap is rejected before anything is read; otherwise
+    the body is counted as it arrives and the request fails with 413 as soon as it passes
+    the cap, while the multipart parser is still spooling it (not after the whole body).
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != router.prefix + "/upload":
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > MAX_UPLOAD_BYTES:
+            await JSONResponse(status_code=413, content={"detail": _too_large_detail()})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_UPLOAD_BYTES:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes a 413
+                    raise HTTPException(status_code=413, detail=_too_large_detail())
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+def _too_large_detail() -> str:
+    return f"File too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)."
+
+async def _save_upload(file: UploadFile, path: str) -> str:
+    """
+    Streams the upload to `path` in chunks, hashing as it goes, and returns the SHA-256.
+    Stops at MAX_UPLOAD_BYTES (413) or a non-ZIP first chunk (400); the partial file is removed.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    buffer = await run_in_threadpool(open, path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0 and not chunk.startswith(ZIP_MAGIC):
+                raise HTTPException(status_code=400, detail="Not an EPUB file (not a ZIP archive).")
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=_too_large_detail())
+            digest.update(chunk)
+            await run_in_threadpool(buffer.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty file.")
+    except BaseException:
+        buffer.close()
+        os.remove(path)
+        raise
+    await run_in_threadpool(buffer.close)
+    return digest.hexdigest()
+
+def _check_epub(path: str):
+    """Raises ValueError unless the file is a ZIP whose mimetype entry is application/epub+zip."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            try:
+                info = archive.getinfo("mimetype")
+            except KeyError:
+                raise ValueError("Not an EPUB file (missing mimetype entry).")
+            # EPUB stores the entry uncompressed; never inflate it (a deflate bomb would pass read())
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("Not an EPUB file (mimetype entry is compressed).")
+            if info.file_size > len(EPUB_MIMETYPE) + 2:
+                raise ValueError("Not an EPUB file (mimetype is not application/epub+zip).")
+            with archive.open(info) as entry:
+                mimetype = entry.read(len(EPUB_MIMETYPE) + 2)
+    except zipfile.BadZipFile:
+        raise ValueError("Not an EPUB file (corrupt ZIP archive).")
+    if mimetype.strip() != EPUB_MIMETYPE:
+        raise ValueError("Not an EPUB file (mimetype is not application/epub+zip).")
+
+@router.post("/upload", response_model=schemas.AnalysisJob, status_code=202)
 async def upload_book(
+    response: Response,
     title: str = Form(...),
     author: Optional[str] = Form(None),
+    on_duplicate: str = Form("existing"),
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
     if not file.filename.lower().endswith(".epub"):
         raise HTTPException(status_code=400, detail="Only EPUB files are allowed.")
+    if on_duplicate not in DUPLICATE_MODES:
+        raise HTTPException(status_code=400, detail=f"on_duplicate must be one of: {', '.join(DUPLICATE_MODES)}")
 
-    # Save file
+    # Stream to a temporary file, hashing on the way, and validate it before any analysis
     file_id = str(uuid.uuid4())
     file_path = os.path.join(UPLOAD_DIR, f"{file_id}.epub")
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Analyze
+    part_path = file_path + ".part"
+    content_hash = await _save_upload(file, part_path)
     try:
-        analysis_result = analysis.analyze_epub(file_path)
-    except Exception as e:
-        print(f"Analysis failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
-
-    # Create Book in DB
-    book_create = schemas.BookCreate(
-        title=title,
-        author=author,
-        description=analysis_result.get("description"),
-        tags=analysis_result.get("tags"),
-        embedding=analysis_result.get("embedding")
+        await run_in_threadpool(_check_epub, part_path)
+    except ValueError as e:
+        os.remove(part_path)
+        raise HTTPException(status_code=400, detail=str(e))
+    os.replace(part_path, file_path)
+
+    # The duplicate checks and job rows commit (and a reuse updates the catalog indexes): off the event loop
+    db_job, duplicate = await run_in_threadpool(
+        _register_upload, db, file_id, title, author, file_path, content_hash, on_duplicate
     )
-    
-    return crud.create_book(db=db, book=book_create)
+    if duplicate:
+        os.remove(file_path)
+        response.status_code = 200
+        return db_job
+
+    # Analyze in the background; the Book is created when the job finishes (poll GET /jobs/{id})
+    jobs.submit(db_job.id)
+    return db_job
+
+def _register_upload(db: Session, file_id: str, title: str, author: Optional[str], file_path: str,
+                     content_hash: str, on_duplicate: str):
+    """
+    Returns (job, duplicate). For a file already analysed (or still being analysed) the job
+    points at that book (or is the running job) and no analysis is needed; otherwise a new
+    queued job for `file_path` is created.
+    """
+    existing = crud.get_book_by_content_hash(db, content_hash)
+    if existing is None and on_duplicate == "existing":
+        active = crud.get_active_analysis_job_by_hash(db, content_hash, updated_after=jobs.stale_before())
+        if active is not None:
+            return active, True
+    if existing is not None:
+        if on_duplicate == "reuse":
+            existing = crud.create_book(db=db, book=schemas.BookCreate(
+                title=title,
+                author=author,
+                description=existing.description,
+                tags=existing.tags,
+                embedding=existing.embedding.tolist() if existing.embedding is not None else None,
+            ))
+        db_job = crud.create_analysis_job(db, file_id, title, author, None, analysis.STAGES,
+                                          content_hash=content_hash, book_id=existing.id)
+        return db_job, True
+    return crud.create_analysis_job(db, file_id, title, author, file_path, analysis.STAGES, content_hash=content_hash), False
 
 @router.get("/{book_id}", response_model=schemas.Book)
 def read_book(book_id: int, db: Session = Depends(get_db)):
@@ -59,6 +186,20 @@ def read_book(book_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Book not found")
     return db_book
 
+@router.get("/{book_id}/similar", response_model=schemas.SimilarBooksResponse)
+def read_similar_books(
+    book_id: int,
+    k: int = Query(10, ge=1, le=similar_books.SIMILAR_TOP_N),
+    db: Session = Depends(get_db)
+):
+    if crud.get_book(db, book_id=book_id) is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    items = [
+        {"book_id": book.id, "title": book.title, "author": book.author, "score": score}
+        for book, score in crud.get_similar_books(db, book_id, k)
+    ]
+    return {"book_id": book_id, "items": items}
+
 @router.get("/", response_model=schemas.BookList)
 def read_books(
     skip: int = 0, 
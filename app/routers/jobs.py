@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from .. import crud, schemas
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+)
+
+@router.get("/{job_id}", response_model=schemas.AnalysisJob)
+def read_job(job_id: str, db: Session = Depends(get_db)):
+    db_job = crud.get_analysis_job(db, job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
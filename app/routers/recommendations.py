@@ -1,72 +1,192 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import json
+import os
 import numpy as np
 
 from .. import crud, models, schemas
-from ..database import get_db
+from ..database import get_db, SessionLocal
+from ..services import catalog_index, ann_index, profiles, rec_cache, batch_recommend, tag_index, facet_index, ranking
 
 router = APIRouter(
     prefix="/users",
     tags=["recommendations"],
 )
 
-def cosine_similarity(v1, v2):
-    if v1 is None or v2 is None:
-        return 0.0
-    return np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
+STRATEGIES = ("vector", "tag", "hybrid")
+# hybrid score = w * vector similarity + (1 - w) * tag overlap
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "0.7"))
+# diversify=λ re-ranks the best MMR_SHORTLIST candidates with Maximal Marginal Relevance
+MMR_SHORTLIST = int(os.getenv("MMR_SHORTLIST", "200"))
+# Facet filters gather the allowed rows only when they are at most this fraction of the
+# catalog; otherwise the whole catalog is scored (one contiguous pass) and the rest masked
+FACET_GATHER_MAX_FRACTION = float(os.getenv("FACET_GATHER_MAX_FRACTION", "0.1"))
+# Safety filters: books never tagged for the facet are excluded (see facet_index.FACET_UNKNOWN_PASSES)
+UNKNOWN_LEVEL_HELP = "Books with no known level are excluded unless the server sets FACET_UNKNOWN_PASSES=1."
+MAX_LEVEL_HELP = "none | mild | moderate | severe (explicit for sexual_content). " + UNKNOWN_LEVEL_HELP
 
 @router.get("/{user_id}/recommendations", response_model=schemas.RecommendationResponse)
 def get_recommendations(
     user_id: int, 
     top_k: int = 10, 
     strategy: str = "hybrid", 
+    max_violence: Optional[str] = Query(None, description=MAX_LEVEL_HELP),
+    max_sexual_content: Optional[str] = Query(None, description=MAX_LEVEL_HELP),
+    max_abuse: Optional[str] = Query(None, description=MAX_LEVEL_HELP),
+    max_self_harm: Optional[str] = Query(None, description=MAX_LEVEL_HELP),
+    max_drug_use: Optional[str] = Query(None, description=MAX_LEVEL_HELP),
+    max_discrimination: Optional[str] = Query(None, description=MAX_LEVEL_HELP),
+    max_age: Optional[str] = Query(None, description="all | 12+ | 15+ | 19+ (URL-encode + as %2B). " + UNKNOWN_LEVEL_HELP),
+    is_fiction: Optional[str] = None,
+    target_audience: Optional[str] = None,
+    diversify: Optional[float] = Query(None, ge=0.0, le=1.0, description="MMR λ: 1 = pure relevance, lower = more diverse"),
     db: Session = Depends(get_db)
 ):
-    # 1. Get user's read books
-    user_books = crud.get_user_books(db, user_id=user_id)
-    if not user_books:
+    if strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy. Choose one of: {', '.join(STRATEGIES)}")
+    try:
+        filters = facet_index.parse_filters({
+            "max_violence": max_violence,
+            "max_sexual_content": max_sexual_content,
+            "max_abuse": max_abuse,
+            "max_self_harm": max_self_harm,
+            "max_drug_use": max_drug_use,
+            "max_discrimination": max_discrimination,
+            "max_age": max_age,
+            "is_fiction": is_fiction,
+            "target_audience": target_audience,
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cache_key = (user_id, strategy, top_k, tuple(sorted(filters.items())), diversify)
+    # Pick up a catalog generation another worker published (rate-limited poll) before the
+    # lookup, so a cache hit can't outlive a catalog change made elsewhere
+    catalog_index.get_index(db)
+    generations = rec_cache.generations(crud.get_shelf_version(db, user_id))
+    cached = rec_cache.get(cache_key, generations)
+    if cached is not None:
+        return cached
+
+    response = _compute_recommendations(db, user_id, top_k, strategy, filters, diversify)
+    rec_cache.put(cache_key, response, generations)
+    return response
+
+def _compute_recommendations(db: Session, user_id: int, top_k: int, strategy: str,
+                             filters: Optional[dict] = None, diversify: Optional[float] = None):
+    # 1. Get user's read books (with the rating/status/recency that weight them)
+    signals = crud.get_user_book_signals(db, [user_id])
+    read_book_ids = [book_id for _, book_id, _, _, _ in signals]
+    if not read_book_ids:
+        return {"user_id": user_id, "strategy": strategy, "items": []}
+
+    index = catalog_index.get_index(db)
+    if index is None:
         return {"user_id": user_id, "strategy": strategy, "items": []}
 
-    # 2. Calculate user profile vector
-    read_vectors = []
-    for ub in user_books:
-        if ub.book and ub.book.embedding:
-            read_vectors.append(ub.book.embedding)
-    
-    if not read_vectors:
+    # 2. User profile vector: the stored running sum, or recomputed with time decay
+    if profiles.PROFILE_HALF_LIFE_DAYS > 0:
+        user_vector = profiles.decayed_profiles(index, signals).get(user_id)
+    else:
+        user_vector = profiles.profile_vector(crud.get_or_build_user_profile(db, user_id))
+    if user_vector is None:
         return {"user_id": user_id, "strategy": strategy, "items": []}
-    
-    user_vector = np.mean(read_vectors, axis=0)
 
-    # 3. Get all books (candidate pool)
+    # 3. Score the candidate pool in one matrix-vector product
+    # Large catalogs: only score the books in the nearest ANN lists
+    rows = None
+    ann = ann_index.get_ann(index) if strategy != "tag" else None
+    if ann is not None:
+        rows = ann.candidate_rows(user_vector)
+        rows = rows[rows < index.size]  # The ANN index may already cover a newer generation
+        if rows.size < top_k + len(read_book_ids):
+            rows = None  # Too few candidates, fall back to exact scoring
+
+    # Facet filters: drop rows before scoring when that is cheaper than scoring them
+    # (ANN candidates, or a very selective mask); otherwise mask them out after scoring
+    excluded = None
+    if filters:
+        allowed = facet_index.get_index(db, index).mask(filters, index.size)
+        if rows is not None:
+            rows = rows[allowed[rows]]
+        elif np.count_nonzero(allowed) <= FACET_GATHER_MAX_FRACTION * index.size:
+            rows = np.flatnonzero(allowed)
+        else:
+            excluded = ~allowed
+        if rows is not None and rows.size == 0:
+            return {"user_id": user_id, "strategy": strategy, "items": []}
+
+    # Tag-only ranking never needs the catalog vector scores
+    vector_scores = index.scores(user_vector, rows) if strategy != "tag" else None
+    all_rows = rows is None
+    if all_rows:
+        rows = np.arange(index.size)
+    read_rows = index.rows_for(read_book_ids)
+
+    # Tag overlap from the inverted index (only the user's own tags are looked up)
+    tag_profile = {}
+    tag_scores = None
+    if strategy != "vector":
+        tags = tag_index.get_index(db, index)
+        # Weighted like the vector profile: dropped or low-rated books pull (or push) less
+        weights = profiles.shelf_weights(signals)
+        tag_profile = tags.user_terms(read_rows, [weights[book_id] for book_id in index.ids[read_rows].tolist()])
+        tag_scores = tags.scores(tag_profile, index.size)
+        if not all_rows:
+            tag_scores = tag_scores[rows]
+
+    # Compressed catalog: re-rank a shortlist with the exact float32 embeddings.
+    # The shortlist is taken on the strategy's own (approximate) score, so hybrid
+    # keeps strong tag matches that are not close vector neighbours.
+    if vector_scores is not None and index.is_compressed and catalog_index.QUANTIZED_RERANK > 0:
+        approx = _combine(strategy, vector_scores, tag_scores)
+        if excluded is not None:
+            approx = np.where(excluded, -np.inf, approx)
+        shortlist = ranking.top_k(approx, max(catalog_index.QUANTIZED_RERANK, top_k) + len(read_book_ids))
+        rows = rows[shortlist]
+        vector_scores = catalog_index.exact_scores(db, index.ids[rows].tolist(), user_vector)
+        if tag_scores is not None:
+            tag_scores = tag_scores[shortlist]
+        all_rows, excluded = False, None  # The shortlist only holds allowed rows
+
+    scores = _combine(strategy, vector_scores, tag_scores).copy()
+    if excluded is not None:
+        scores[excluded] = -np.inf
+
     # Exclude books already read
-    read_book_ids = {ub.book_id for ub in user_books}
-    all_books = crud.get_books(db, limit=1000) # Simple limit for now
-    candidates = [b for b in all_books if b.id not in read_book_ids and b.embedding]
-
-    # 4. Calculate scores
-    recommendations = []
-    for book in candidates:
-        sim = cosine_similarity(user_vector, book.embedding)
-        
-        recommendations.append({
-            "book": book,
-            "score": float(sim)
-        })
-    
-    # 5. Sort and return top K
-    recommendations.sort(key=lambda x: x["score"], reverse=True)
-    top_recs = recommendations[:top_k]
-    
+    if read_rows.size:
+        scores[read_rows if all_rows else np.isin(rows, read_rows)] = -np.inf
+
+    # 4. Top K selection (only winners are loaded from the DB)
+    if diversify is None:
+        top = ranking.top_k(scores, top_k)
+    else:
+        shortlist = ranking.top_k(scores, max(MMR_SHORTLIST, top_k))
+        picks = ranking.mmr(scores[shortlist], index.vectors(rows[shortlist]), top_k, diversify)
+        top = shortlist[picks]
+    top_rows = rows[top]
+    top_ids = index.ids[top_rows].tolist()
+    # Tag-only ranking scores just the winners' vector similarity for the reasons
+    top_similarity = vector_scores[top] if vector_scores is not None else index.scores(user_vector, top_rows)
+    books_by_id = {b.id: b for b in crud.get_books_by_ids(db, top_ids)}
+
     items = []
-    for rec in top_recs:
+    for i, book_id, similarity in zip(top.tolist(), top_ids, top_similarity.tolist()):
+        book = books_by_id.get(book_id)
+        if book is None:
+            continue
+        reasons = {"vector_similarity": float(similarity)}
+        if tag_scores is not None:
+            reasons["tag_overlap"] = float(tag_scores[i])
+            reasons["matched_tags"] = tags.matched_terms(tag_profile, rows[i])
         items.append({
-            "book_id": rec["book"].id,
-            "title": rec["book"].title,
-            "author": rec["book"].author,
-            "score": rec["score"],
-            "reasons": {"vector_similarity": rec["score"]}
+            "book_id": book.id,
+            "title": book.title,
+            "author": book.author,
+            "score": float(scores[i]),
+            "reasons": reasons
         })
         
     return {
@@ -74,3 +194,28 @@ def get_recommendations(
         "strategy": strategy,
         "items": items
     }
+
+def _combine(strategy: str, vector_scores: Optional[np.ndarray], tag_scores: Optional[np.ndarray]) -> np.ndarray:
+    if strategy == "vector":
+        return vector_scores
+    if strategy == "tag":
+        return tag_scores
+    return HYBRID_VECTOR_WEIGHT * vector_scores + (1.0 - HYBRID_VECTOR_WEIGHT) * tag_scores
+
+@router.post("/recommendations/batch")
+def batch_recommendations(request: schemas.BatchRecommendationRequest):
+    """Streams top-k recommendations for many users as JSON Lines (one user per line)."""
+    if not request.all_users and not request.user_ids:
+        raise HTTPException(status_code=400, detail="Provide user_ids or set all_users=true.")
+    user_ids = None if request.all_users else request.user_ids
+
+    def stream():
+        # The request-scoped session may be closed before streaming ends, so use our own
+        db = SessionLocal()
+        try:
+            for result in batch_recommend.iter_batch_recommendations(db, user_ids, top_k=request.top_k):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -12,6 +12,7 @@ class BookBase(BaseModel):
 
 class BookCreate(BookBase):
     embedding: Optional[List[float]] = None
+    content_hash: Optional[str] = None
 
 class Book(BookBase):
     id: int
@@ -25,6 +26,32 @@ class BookList(BaseModel):
     items: List[Book]
     total: int
 
+class SimilarBook(BaseModel):
+    book_id: int
+    title: str
+    author: Optional[str]
+    score: float
+
+class SimilarBooksResponse(BaseModel):
+    book_id: int
+    items: List[SimilarBook]
+
+# --- Analysis Jobs ---
+class AnalysisJob(BaseModel):
+    id: str
+    status: str
+    stage: Optional[str] = None
+    stages: Optional[Dict[str, Any]] = None
+    title: str
+    author: Optional[str] = None
+    book_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # --- Users ---
 class UserBase(BaseModel):
     name: str
@@ -73,3 +100,8 @@ class RecommendationResponse(BaseModel):
     user_id: int
     strategy: str
     items: List[RecommendationItem]
+
+class BatchRecommendationRequest(BaseModel):
+    user_ids: Optional[List[int]] = None
+    all_users: bool = False
+    top_k: int = 10
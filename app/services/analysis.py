@@ -2,115 +2,117 @@ import os
 import time
 import json
 import random
-import shutil
+import hashlib
 import uuid
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Optional
 from .modules import converter, splitter, tagger, aggregator, vectorizer
 
-# Temp directory for processing
-TEMP_DIR = "storage/temp"
-os.makedirs(TEMP_DIR, exist_ok=True)
+# The analysis runs entirely in memory. Set ANALYSIS_DEBUG_DIR to also write each run's
+# text, chunk tags and aggregated tags to {ANALYSIS_DEBUG_DIR}/{uuid}/ (kept, for debugging).
+ANALYSIS_DEBUG_DIR = os.getenv("ANALYSIS_DEBUG_DIR")
 
-def analyze_epub(file_path: str) -> Dict[str, Any]:
+# Pipeline stages, in order. analyze_epub reports progress as
+# progress(stage, state, detail) with state "running" or "done".
+STAGES = ["convert", "split", "tag", "aggregate", "embed"]
+
+def analyze_epub(file_path: str, progress: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
     """
     Analyzes an EPUB file and returns metadata, tags, and embedding.
     """
+    if progress is None:
+        progress = lambda stage, state, detail=None: None
     start_time = time.time()
     print(f"🚀 Starting analysis for: {file_path}")
 
-    session_id = str(uuid.uuid4())
-    session_dir = os.path.join(TEMP_DIR, session_id)
-    os.makedirs(session_dir, exist_ok=True)
+    # 1. Convert EPUB to TXT
+    step_start = time.time()
+    print("  [1/5] Converting EPUB to TXT...", end="", flush=True)
+    progress("convert", "running")
+    text_content = converter.epub_to_text(file_path)
+    print(f" Done ({time.time() - step_start:.2f}s)")
+    progress("convert", "done", f"{len(text_content)} chars")
 
-    try:
-        # 1. Convert EPUB to TXT
-        step_start = time.time()
-        print("  [1/5] Converting EPUB to TXT...", end="", flush=True)
-        txt_filename = "content.txt"
-        txt_path = os.path.join(session_dir, txt_filename)
-        
-        converter.convert_epub_to_txt(file_path, txt_path)
-        
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            text_content = f.read()
-        print(f" Done ({time.time() - step_start:.2f}s)")
+    # 2. Split into Chunks (for Tagging)
+    step_start = time.time()
+    print("  [2/5] Splitting text into chunks...", end="", flush=True)
+    progress("split", "running")
+    chunks = splitter.split_into_chunks(text_content)
+    print(f" Done ({len(chunks)} chunks, {time.time() - step_start:.2f}s)")
+    progress("split", "done", f"{len(chunks)} chunks")
+    
+    # 3. Sampling & Tagging
+    step_start = time.time()
+    print("  [3/5] Sampling and Tagging...", flush=True)
+    target_sample_count = 5
+    # Sampling is seeded by the text, so re-analysing the same book picks the same
+    # chunks and every tag/embedding comes from the result cache
+    content_seed = hashlib.sha256(text_content.encode("utf-8")).hexdigest()
+    selected_indices = _sample_indices(len(chunks), target_sample_count, f"{content_seed}:tag")
+    progress("tag", "running", f"0/{len(selected_indices)} chunks")
+    
+    def on_tagged(done, total):
+        print(f"    - Tagged {done}/{total} chunks", flush=True)
+        progress("tag", "running", f"{done}/{total} chunks")
 
-        # 2. Split into Chunks (for Tagging)
-        step_start = time.time()
-        print("  [2/5] Splitting text into chunks...", end="", flush=True)
-        chunks = splitter.split_into_chunks(text_content)
-        print(f" Done ({len(chunks)} chunks, {time.time() - step_start:.2f}s)")
-        
-        # 3. Sampling & Tagging
-        step_start = time.time()
-        print("  [3/5] Sampling and Tagging...", flush=True)
-        target_sample_count = 5
-        selected_indices = _sample_indices(len(chunks), target_sample_count)
-        
-        tag_results = []
-        for i, idx in enumerate(selected_indices):
-            print(f"    - Processing chunk {i+1}/{len(selected_indices)}...", end="", flush=True)
-            chunk_text = chunks[idx]
-            tags = tagger.tag_chunk_with_gpt(chunk_text)
-            if tags:
-                tag_results.append(tags)
-            print(" Done")
-        print(f"    > Tagging complete ({time.time() - step_start:.2f}s)")
-        
-        # 4. Aggregate Tags
-        step_start = time.time()
-        print("  [4/5] Aggregating tags...", end="", flush=True)
-        tags_dir = os.path.join(session_dir, "tags")
-        os.makedirs(tags_dir, exist_ok=True)
-        
-        for i, tags in enumerate(tag_results):
-            with open(os.path.join(tags_dir, f"chunk_tag_{i:02d}.json"), 'w', encoding='utf-8') as f:
-                json.dump(tags, f, ensure_ascii=False)
-                
-        # Use aggregator module
-        agg_output_dir = os.path.join(session_dir, "aggregated")
-        aggregator.aggregate_tags(tags_dir, agg_output_dir, "book")
-        
-        final_tags_path = os.path.join(agg_output_dir, "book_tag_all.json")
-        final_tags = {}
-        if os.path.exists(final_tags_path):
-            with open(final_tags_path, 'r', encoding='utf-8') as f:
-                final_tags = json.load(f)
-        print(f" Done ({time.time() - step_start:.2f}s)")
+    # Sampled chunks are tagged concurrently (up to tagger.TAG_CONCURRENCY), results in order
+    tag_results = tagger.tag_chunks([chunks[idx] for idx in selected_indices], on_done=on_tagged)
+    tag_results = [tags for tags in tag_results if tags]
+    print(f"    > Tagging complete ({time.time() - step_start:.2f}s)")
+    progress("tag", "done", f"{len(tag_results)}/{len(selected_indices)} chunks tagged")
+    
+    # 4. Aggregate Tags
+    step_start = time.time()
+    print("  [4/5] Aggregating tags...", end="", flush=True)
+    progress("aggregate", "running")
+    final_tags = aggregator.aggregate(tag_results)
+    print(f" Done ({time.time() - step_start:.2f}s)")
+    progress("aggregate", "done")
 
-        # 5. Vector Processing
-        step_start = time.time()
-        print("  [5/5] Generating vectors...", flush=True)
-        # Re-split for vectors (chunk_size=500)
-        vec_chunks = splitter.split_into_chunks(text_content, chunk_size=500)
-        vec_selected_indices = _sample_indices(len(vec_chunks), target_sample_count)
-        
-        generated_vectors = []
-        for i, idx in enumerate(vec_selected_indices):
-            print(f"    - Vectorizing chunk {i+1}/{len(vec_selected_indices)}...", end="", flush=True)
-            chunk_text = vec_chunks[idx]
-            vector = vectorizer.get_embedding(chunk_text)
-            if vector:
-                generated_vectors.append(vector)
-            print(" Done")
-        
-        avg_vector = vectorizer.get_average_embedding(generated_vectors)
-        print(f"    > Vectorization complete ({time.time() - step_start:.2f}s)")
-        
-        total_time = time.time() - start_time
-        print(f"✅ Analysis finished successfully in {total_time:.2f}s")
+    # 5. Vector Processing
+    step_start = time.time()
+    print("  [5/5] Generating vectors...", flush=True)
+    # Re-split for vectors (chunk_size=500)
+    vec_chunks = splitter.split_into_chunks(text_content, chunk_size=500)
+    vec_selected_indices = _sample_indices(len(vec_chunks), target_sample_count, f"{content_seed}:vec")
+    progress("embed", "running", f"0/{len(vec_selected_indices)} chunks")
+    
+    # All sampled chunks go out in one batched embeddings request
+    print(f"    - Vectorizing {len(vec_selected_indices)} chunks in one batch...", end="", flush=True)
+    vectors = vectorizer.get_embeddings([vec_chunks[idx] for idx in vec_selected_indices])
+    generated_vectors = [vector for vector in vectors if vector]
+    print(f" Done ({len(generated_vectors)}/{len(vectors)})")
+    
+    avg_vector = vectorizer.get_average_embedding(generated_vectors)
+    print(f"    > Vectorization complete ({time.time() - step_start:.2f}s)")
+    progress("embed", "done", f"{len(generated_vectors)} vectors")
+    
+    if ANALYSIS_DEBUG_DIR:
+        _dump_debug(text_content, tag_results, final_tags)
+
+    total_time = time.time() - start_time
+    print(f"✅ Analysis finished successfully in {total_time:.2f}s")
 
-        return {
-            "tags": final_tags,
-            "embedding": avg_vector
-        }
+    return {
+        "tags": final_tags,
+        "embedding": avg_vector
+    }
 
-    finally:
-        # Cleanup
-        if os.path.exists(session_dir):
-            shutil.rmtree(session_dir)
+def _dump_debug(text_content: str, tag_results: List[Dict[str, Any]], final_tags: Dict[str, Any]):
+    session_dir = os.path.join(ANALYSIS_DEBUG_DIR, str(uuid.uuid4()))
+    tags_dir = os.path.join(session_dir, "tags")
+    os.makedirs(tags_dir, exist_ok=True)
+    with open(os.path.join(session_dir, "content.txt"), 'w', encoding='utf-8') as f:
+        f.write(text_content)
+    for i, tags in enumerate(tag_results):
+        with open(os.path.join(tags_dir, f"chunk_tag_{i:02d}.json"), 'w', encoding='utf-8') as f:
+            json.dump(tags, f, ensure_ascii=False)
+    with open(os.path.join(session_dir, "book_tag_all.json"), 'w', encoding='utf-8') as f:
+        json.dump(final_tags, f, ensure_ascii=False, indent=2)
+    print(f"    > Debug output written to {session_dir}")
 
-def _sample_indices(total_length: int, sample_count: int) -> List[int]:
+def _sample_indices(total_length: int, sample_count: int, seed: str) -> List[int]:
+    """One random index per equal segment, deterministic for a given seed."""
+    rng = random.Random(seed)
     if total_length <= sample_count:
         return list(range(total_length))
     
@@ -123,6 +125,6 @@ def _sample_indices(total_length: int, sample_count: int) -> List[int]:
             end_idx = total_length
         
         if start_idx < end_idx:
-            selected_idx = random.randint(start_idx, end_idx - 1)
+            selected_idx = rng.randint(start_idx, end_idx - 1)
             indices.append(selected_idx)
     return indices
@@ -0,0 +1,190 @@
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from ..database import DB_PATH
+from .catalog_index import CatalogIndex, DerivedIndex, DerivedIndexSlot, prepare
+from .ranking import top_k_indices
+
+# IVF (inverted file) approximate nearest-neighbour index over the catalog.
+# Books are clustered with spherical k-means; a query only scores the books in the
+# `nprobe` clusters whose centroids are closest to it. The index stores book ids per
+# cluster and scores them through the CatalogIndex, so it adds almost no memory.
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", os.path.splitext(DB_PATH)[0] + ".ann.npz")
+ANN_MIN_CATALOG_SIZE = int(os.getenv("ANN_MIN_CATALOG_SIZE", "20000"))  # below this, exact scoring is cheap enough
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))  # more lists = higher recall, higher latency
+
+def default_nlist(n: int) -> int:
+    return max(1, min(4096, int(round(np.sqrt(n)))))
+
+
+def spherical_kmeans(matrix: np.ndarray, nlist: int, n_iter: int = 15,
+                     sample_size: int = 100000, seed: int = 42) -> np.ndarray:
+    """Trains `nlist` unit-norm centroids on (a sample of) the L2-normalized rows."""
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    sample = matrix if n <= sample_size else matrix[rng.choice(n, sample_size, replace=False)]
+    nlist = min(nlist, sample.shape[0])
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = _assign(sample, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+        # Re-seed empty clusters with random points
+        empty = np.flatnonzero(~nonempty)
+        if empty.size:
+            sums[empty] = sample[rng.choice(sample.shape[0], empty.size, replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    out = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], block):
+        out[start:start + block] = np.argmax(matrix[start:start + block] @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex(DerivedIndex):
+    def __init__(self, centroids: np.ndarray, list_ids: List[np.ndarray]):
+        super().__init__()
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_rows: List[np.ndarray] = []
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.centroids.shape[1]
+
+    @classmethod
+    def train(cls, catalog: CatalogIndex, nlist: Optional[int] = None, n_iter: int = 15) -> "IVFIndex":
+        matrix = catalog.vectors()
+        centroids = spherical_kmeans(matrix, nlist or default_nlist(matrix.shape[0]), n_iter=n_iter)
+        assign = _assign(matrix, centroids)
+        ids = catalog.ids
+        ivf = cls(centroids, [ids[assign == c].copy() for c in range(centroids.shape[0])])
+        ivf.attach(catalog)
+        return ivf
+
+    def attach(self, catalog: CatalogIndex):
+        """Resolves book ids to catalog rows; books missing from the lists are assigned now."""
+        self.catalog = catalog
+        known = set()
+        self.list_rows = []
+        for ids in self.list_ids:
+            rows = [catalog.row_of[b] for b in ids.tolist() if b in catalog.row_of]
+            known.update(ids.tolist())
+            self.list_rows.append(np.asarray(rows, dtype=np.int64))
+        self.list_ids = [catalog.ids[rows] for rows in self.list_rows]
+        missing = [b for b in catalog.ids.tolist() if b not in known]
+        self._assign_rows(catalog.rows_for(missing))
+        self.synced = catalog.size
+
+    def add_rows(self, db, start: int, stop: int):
+        self._assign_rows(np.arange(start, stop, dtype=np.int64))
+
+    def _assign_rows(self, rows: np.ndarray):
+        if rows.size == 0:
+            return
+        assign = _assign(self.catalog.vectors(rows), self.centroids)
+        ids = self.catalog.ids[rows]
+        for c in np.unique(assign).tolist():
+            hit = assign == c
+            self.list_ids[c] = np.append(self.list_ids[c], ids[hit])
+            self.list_rows[c] = np.append(self.list_rows[c], rows[hit])
+
+    def candidate_rows(self, vector, nprobe: int = ANN_NPROBE) -> np.ndarray:
+        """Catalog rows in the `nprobe` lists nearest to `vector`."""
+        q = prepare(vector)
+        if q is None or q.shape[0] != self.dim:
+            return np.empty(0, dtype=np.int64)
+        probe = top_k_indices(self.centroids @ q, min(nprobe, self.nlist))
+        return np.concatenate([self.list_rows[c] for c in probe])
+
+    def search(self, vector, k: int, nprobe: int = ANN_NPROBE):
+        """Approximate top-k: returns (catalog rows, scores), best first."""
+        rows = self.candidate_rows(vector, nprobe)
+        if rows.size == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        scores = self.catalog.scores(vector, rows)
+        top = top_k_indices(scores, k)
+        return rows[top], scores[top]
+
+    def save(self, path: str = ANN_INDEX_PATH):
+        sizes = np.array([len(ids) for ids in self.list_ids], dtype=np.int64)
+        ids = np.concatenate(self.list_ids) if self.list_ids else np.empty(0, dtype=np.int64)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, ids=ids, sizes=sizes)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = ANN_INDEX_PATH) -> "IVFIndex":
+        data = np.load(path)
+        offsets = np.concatenate(([0], np.cumsum(data["sizes"])))
+        ids = data["ids"]
+        list_ids = [ids[offsets[i]:offsets[i + 1]] for i in range(len(data["sizes"]))]
+        return cls(data["centroids"].astype(np.float32), list_ids)
+
+
+def recall_at_k(ivf: IVFIndex, queries: np.ndarray, k: int = 10, nprobe: int = ANN_NPROBE) -> float:
+    """Mean overlap between the ANN top-k and the exact top-k for each query row."""
+    hits = 0
+    for q in queries:
+        exact = set(top_k_indices(ivf.catalog.scores(q), k).tolist())
+        approx, _ = ivf.search(q, k, nprobe)
+        hits += len(exact.intersection(approx.tolist()))
+    return hits / float(len(queries) * k)
+
+
+def _load_or_train(db, catalog: CatalogIndex) -> IVFIndex:
+    """The persisted index attached to `catalog`, or a newly trained (and saved) one."""
+    ivf = None
+    if os.path.exists(ANN_INDEX_PATH):
+        try:
+            ivf = IVFIndex.load(ANN_INDEX_PATH)
+            if ivf.dim != catalog.dim:
+                ivf = None
+        except Exception as e:
+            print(f"[WARNING] Failed to load ANN index {ANN_INDEX_PATH}: {e}")
+            ivf = None
+    if ivf is not None:
+        ivf.attach(catalog)
+        return ivf
+    start = time.time()
+    print(f"🛠️  Training ANN index over {catalog.size} books...")
+    ivf = IVFIndex.train(catalog)
+    ivf.save(ANN_INDEX_PATH)
+    print(f"✅  ANN index ({ivf.nlist} lists) saved to {ANN_INDEX_PATH} ({time.time() - start:.2f}s)")
+    return ivf
+
+
+_ann = DerivedIndexSlot(_load_or_train)
+
+
+def get_ann(catalog: Optional[CatalogIndex]) -> Optional[IVFIndex]:
+    """
+    Returns the ANN index for the catalog, or None when the catalog is small enough
+    for exact scoring. Loads the persisted index next to books.db, training it if missing.
+    Candidate rows may run past `catalog.size` when the index is already on a newer generation.
+    """
+    if catalog is None or catalog.size < ANN_MIN_CATALOG_SIZE:
+        return None
+    return _ann.get(None, catalog)
+
+
+def add_book(book_id: int):
+    """Assigns a newly indexed book (and any other new catalog rows) to the nearest lists of the loaded ANN index."""
+    _ann.follow(None)
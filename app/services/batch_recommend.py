@@ -0,0 +1,103 @@
+import os
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .. import crud, models
+from . import catalog_index, profiles, ranking
+
+# Scores many users in one go: a (users x d) profile matrix times the catalog matrix,
+# in blocks sized so the (users x books) score block stays under BATCH_MAX_SCORE_CELLS floats.
+BATCH_MAX_SCORE_CELLS = int(os.getenv("BATCH_MAX_SCORE_CELLS", str(32 * 1024 * 1024)))  # 128 MB of float32
+BATCH_MAX_USERS_PER_BLOCK = 1024
+
+
+def all_user_ids(db: Session) -> List[int]:
+    return [user_id for (user_id,) in db.query(models.User.id).order_by(models.User.id)]
+
+
+def _block_size(catalog_size: int) -> int:
+    return max(1, min(BATCH_MAX_USERS_PER_BLOCK, BATCH_MAX_SCORE_CELLS // max(1, catalog_size)))
+
+
+def _read_book_ids(db: Session, user_ids: List[int]) -> Dict[int, List[int]]:
+    read = {user_id: [] for user_id in user_ids}
+    rows = db.query(models.UserBook.user_id, models.UserBook.book_id).filter(models.UserBook.user_id.in_(user_ids))
+    for user_id, book_id in rows:
+        read[user_id].append(book_id)
+    return read
+
+
+def _profile_vectors(db: Session, user_ids: List[int], index) -> Dict[int, np.ndarray]:
+    if profiles.PROFILE_HALF_LIFE_DAYS > 0:
+        decayed = profiles.decayed_profiles(index, crud.get_user_book_signals(db, user_ids))
+        return {user_id: catalog_index.prepare(v) for user_id, v in decayed.items()}
+    found = {
+        p.user_id: p
+        for p in db.query(models.UserProfile).filter(models.UserProfile.user_id.in_(user_ids))
+    }
+    vectors = {}
+    for user_id in user_ids:
+        profile = found.get(user_id)
+        if profile is None:
+            profile = crud.get_or_build_user_profile(db, user_id)
+        vector = catalog_index.prepare(profiles.profile_vector(profile))
+        if vector is not None:
+            vectors[user_id] = vector
+    return vectors
+
+
+def iter_batch_recommendations(db: Session, user_ids: Optional[List[int]] = None,
+                               top_k: int = 10) -> Iterator[dict]:
+    """
+    Yields one recommendation response dict per user, in the order of `user_ids`
+    (all users when None). Read books are excluded per user.
+    """
+    if user_ids is None:
+        user_ids = all_user_ids(db)
+    index = catalog_index.get_index(db)
+
+    def empty(user_id):
+        return {"user_id": user_id, "strategy": "vector", "items": []}
+
+    if index is None or index.size == 0:
+        for user_id in user_ids:
+            yield empty(user_id)
+        return
+
+    block = _block_size(index.size)
+    for start in range(0, len(user_ids), block):
+        block_ids = user_ids[start:start + block]
+        vectors = _profile_vectors(db, block_ids, index)
+        scored_ids = [user_id for user_id in block_ids if user_id in vectors and vectors[user_id].shape[0] == index.dim]
+        results = {}
+        if scored_ids:
+            scores = index.score_block(np.stack([vectors[user_id] for user_id in scored_ids]))
+            read = _read_book_ids(db, scored_ids)
+            for i, user_id in enumerate(scored_ids):
+                read_rows = index.rows_for(read[user_id])
+                if read_rows.size:
+                    scores[i, read_rows[read_rows < scores.shape[1]]] = -np.inf
+            top = ranking.top_k_indices_2d(scores, top_k)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+
+            winner_ids = set(index.ids[top.ravel()].tolist())
+            books = {b.id: b for b in crud.get_books_by_ids(db, list(winner_ids))}
+            for i, user_id in enumerate(scored_ids):
+                items = []
+                for book_id, score in zip(index.ids[top[i]].tolist(), top_scores[i].tolist()):
+                    book = books.get(book_id)
+                    if book is None or not np.isfinite(score):
+                        continue
+                    items.append({
+                        "book_id": book.id,
+                        "title": book.title,
+                        "author": book.author,
+                        "score": score,
+                        "reasons": {"vector_similarity": score}
+                    })
+                results[user_id] = {"user_id": user_id, "strategy": "vector", "items": items}
+
+        for user_id in block_ids:
+            yield results.get(user_id) or empty(user_id)
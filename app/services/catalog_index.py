@@ -0,0 +1,514 @@
+import os
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .. import models
+from . import embedding_store, quantization, rec_cache
+
+# Process-wide catalog index.
+# Book embeddings are kept as one contiguous float32 matrix (rows L2-normalized)
+# so scoring a user is a single matrix-vector product.
+# With CATALOG_QUANTIZATION=int8|pq the matrix is replaced by compressed codes and
+# scoring runs in the compressed domain; the best QUANTIZED_RERANK candidates are
+# then re-scored with the exact float32 embeddings read from the DB (0 = no re-rank).
+# CATALOG_DIM keeps only the first N dimensions of every vector (re-normalized), so
+# text-embedding-3 vectors can be indexed and scored at 256/512/1024 dims.
+CATALOG_DIM = int(os.getenv("CATALOG_DIM", "0"))  # 0 = full dimension
+CATALOG_QUANTIZATION = os.getenv("CATALOG_QUANTIZATION", "none")
+QUANTIZED_RERANK = int(os.getenv("QUANTIZED_RERANK", "100"))
+# A carried-over quantizer is retrained once the catalog outgrows its training set by this factor
+QUANTIZER_RETRAIN_GROWTH = float(os.getenv("QUANTIZER_RETRAIN_GROWTH", "2"))
+# CATALOG_MMAP=1: the float32 rows are memory-mapped from the shared embedding store
+# (see embedding_store) instead of being rebuilt from books.db in every worker.
+# Workers check the store's CURRENT pointer at most every CATALOG_STORE_POLL_SECONDS
+# and swap to a newer generation published by another process. A generation that
+# extends the live one (same lineage) reuses its id map, quantizer and codes, and the
+# tag/facet/ANN indexes only add its new rows. The quantizer is persisted per lineage
+# and retrained only when the catalog outgrows its training set (QUANTIZER_RETRAIN_GROWTH).
+CATALOG_MMAP = os.getenv("CATALOG_MMAP", "1") == "1"
+CATALOG_STORE_POLL_SECONDS = float(os.getenv("CATALOG_STORE_POLL_SECONDS", "2"))
+
+_index = None
+_generation = None  # store generation (base matrix, generation number) the live index was opened from
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def normalize(vector) -> Optional[np.ndarray]:
+    """Returns the vector as float32 with unit L2 norm (None for empty/zero vectors)."""
+    if vector is None:
+        return None
+    v = np.asarray(vector, dtype=np.float32)
+    if v.size == 0:
+        return None
+    norm = np.linalg.norm(v)
+    if norm == 0:
+        return None
+    return v / norm
+
+
+def prepare(vector) -> Optional[np.ndarray]:
+    """Truncates to CATALOG_DIM (when set) and L2-normalizes: the form stored in the index."""
+    if vector is not None and CATALOG_DIM > 0:
+        vector = np.asarray(vector, dtype=np.float32)[:CATALOG_DIM]
+    return normalize(vector)
+
+
+class CatalogIndex:
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self.size = 0
+        self.lineage = None  # embedding_store lineage the rows were opened from (None: built here)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._base = np.empty((0, dim), dtype=np.float32)  # Leading read-only rows (a store memmap)
+        self._matrix = np.empty((capacity, dim), dtype=np.float32)  # Growable rows after the base
+        self._codes = None
+        self.quantizer = None
+        self.row_of = {}
+
+    @classmethod
+    def from_arrays(cls, ids: np.ndarray, matrix: np.ndarray, tail: Optional[np.ndarray] = None,
+                    lineage: Optional[str] = None, previous: Optional["CatalogIndex"] = None) -> "CatalogIndex":
+        """
+        Wraps prepared rows (e.g. a read-only memmap) without copying them; `tail` rows
+        (store deltas) follow them. The id -> row map is carried over from `previous`
+        when this index extends it.
+        """
+        n_tail = 0 if tail is None else tail.shape[0]
+        index = cls(dim=matrix.shape[1], capacity=max(1, n_tail))
+        index.lineage = lineage
+        index._ids = np.asarray(ids, dtype=np.int64)
+        index._base = matrix
+        if n_tail:
+            index._matrix[:n_tail] = tail
+        index.size = len(index._ids)
+        if previous is not None and index.extends(previous):
+            index.row_of = dict(previous.row_of)
+            start = previous.size
+        else:
+            start = 0
+        index.row_of.update((book_id, row) for row, book_id in enumerate(index._ids[start:].tolist(), start=start))
+        return index
+
+    def extends(self, older: "CatalogIndex") -> bool:
+        """True when this index starts with `older`'s rows (same books, same order, same vectors)."""
+        if older is self:
+            return True
+        return self.lineage is not None and self.lineage == older.lineage and self.size >= older.size
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self.size]
+
+    @property
+    def _base_rows(self) -> int:
+        return 0 if self._base is None else self._base.shape[0]
+
+    def _blocks(self):
+        """(first row, float32 rows) of the base and the growable part, skipping empty ones."""
+        n_base = self._base_rows
+        if n_base:
+            yield 0, self._base
+        if self.size > n_base:
+            yield n_base, self._matrix[:self.size - n_base]
+
+    @property
+    def matrix(self) -> Optional[np.ndarray]:
+        """Float32 rows, or None when the index is compressed (use vectors()). Copies when store deltas are present."""
+        if self.is_compressed:
+            return None
+        blocks = [block for _, block in self._blocks()]
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate(blocks) if blocks else self._matrix[:0]
+
+    @property
+    def codes(self) -> Optional[np.ndarray]:
+        if self._codes is None:
+            return None
+        return self._codes[:self.size]
+
+    @property
+    def is_compressed(self) -> bool:
+        return self.quantizer is not None
+
+    @property
+    def nbytes(self) -> int:
+        if self.is_compressed:
+            return int(self.codes.nbytes + self.ids.nbytes)
+        return int(sum(block.nbytes for _, block in self._blocks()) + self.ids.nbytes)
+
+    def _grow(self, needed: int):
+        # Swap in new buffers; readers holding the old views keep a consistent snapshot.
+        if needed > len(self._ids):
+            self._ids = _grown(self._ids, self.size, needed)
+        if self.is_compressed:
+            if needed > self._codes.shape[0]:
+                self._codes = _grown(self._codes, self.size, needed)
+        elif needed - self._base_rows > self._matrix.shape[0]:
+            self._matrix = _grown(self._matrix, self.size - self._base_rows, needed - self._base_rows)
+
+    def _store(self, row: int, v: np.ndarray):
+        if self.is_compressed:
+            self._codes[row] = self.quantizer.encode(v)[0]
+        elif row < self._base_rows:
+            if not self._base.flags.writeable:
+                self._base = np.array(self._base)  # Private copy of the read-only store rows
+            self._base[row] = v
+        else:
+            self._matrix[row - self._base_rows] = v
+
+    def add(self, book_id: int, embedding) -> bool:
+        v = prepare(embedding)
+        if v is None or v.shape[0] != self.dim:
+            return False
+        row = self.row_of.get(book_id)
+        if row is not None:
+            self._store(row, v)
+            return True
+        self._grow(self.size + 1)
+        self._ids[self.size] = book_id
+        self._store(self.size, v)
+        self.row_of[book_id] = self.size
+        self.size += 1
+        return True
+
+    def compress(self, quantizer, fit: bool = True, codes: Optional[np.ndarray] = None):
+        """
+        Replaces the float32 rows with `quantizer` codes, training it on the rows first when
+        `fit`. `codes` are already encoded leading rows to keep (from a generation this one extends).
+        """
+        if fit:
+            quantizer.fit(self.matrix)
+        out = np.empty((max(1, len(self._ids)), quantizer.code_width()), dtype=quantizer.code_dtype)
+        done = 0
+        if codes is not None:
+            done = codes.shape[0]
+            out[:done] = codes
+        for first, block in self._blocks():
+            for start in range(max(first, done), first + block.shape[0], quantization.SCORE_BLOCK_ROWS):
+                end = min(start + quantization.SCORE_BLOCK_ROWS, first + block.shape[0])
+                out[start:end] = quantizer.encode(block[start - first:end - first])
+        self._codes = out
+        self.quantizer = quantizer
+        self._base = None
+        self._matrix = None
+
+    def vectors(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Float32 rows (reconstructed from the codes when compressed)."""
+        if self.is_compressed:
+            return self.quantizer.decode(self.codes if rows is None else self.codes[rows])
+        if rows is None:
+            return self.matrix
+        rows = np.asarray(rows, dtype=np.int64)
+        n_base = self._base_rows
+        if n_base == 0:
+            return self._matrix[rows]
+        out = np.empty((rows.shape[0], self.dim), dtype=np.float32)
+        low = rows < n_base
+        out[low] = self._base[rows[low]]
+        out[~low] = self._matrix[rows[~low] - n_base]
+        return out
+
+    def scores(self, vector, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity against `vector` for every catalog book (or only `rows`)."""
+        count = self.size if rows is None else len(rows)
+        v = prepare(vector)
+        if v is None or v.shape[0] != self.dim:
+            return np.zeros(count, dtype=np.float32)
+        if self.is_compressed:
+            return self.quantizer.scores(self.codes if rows is None else self.codes[rows], v)
+        if rows is not None:
+            return self.vectors(rows) @ v
+        parts = [block @ v for _, block in self._blocks()]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+    def score_block(self, vectors: np.ndarray) -> np.ndarray:
+        """(users x books) scores for a stack of unit-norm query vectors."""
+        if self.is_compressed:
+            return np.stack([self.quantizer.scores(self.codes, v) for v in vectors])
+        parts = [vectors @ block.T for _, block in self._blocks()]
+        return np.hstack(parts) if parts else np.zeros((vectors.shape[0], 0), dtype=np.float32)
+
+    def rows_for(self, book_ids) -> np.ndarray:
+        rows = [self.row_of[b] for b in book_ids if b in self.row_of]
+        return np.asarray(rows, dtype=np.int64)
+
+
+def _grown(array: np.ndarray, used: int, needed: int) -> np.ndarray:
+    """A copy of array[:used] in a buffer with room for at least `needed` rows (doubling)."""
+    capacity = max(1, array.shape[0])
+    while capacity < needed:
+        capacity *= 2
+    out = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    out[:used] = array[:used]
+    return out
+
+
+def exact_scores(db: Session, book_ids: List[int], vector) -> np.ndarray:
+    """Cosine similarity computed from the full stored float32 embeddings (for re-ranking)."""
+    out = np.zeros(len(book_ids), dtype=np.float32)
+    if vector is None or not book_ids:
+        return out
+    vector = np.asarray(vector, dtype=np.float32)
+    position = {book_id: i for i, book_id in enumerate(book_ids)}
+    rows = db.query(models.Book.id, models.Book.embedding).filter(models.Book.id.in_(book_ids))
+    for book_id, embedding in rows:
+        if embedding is None:
+            continue
+        n = min(len(embedding), len(vector))  # Reduced-dimension books compare on the shared prefix
+        e, v = normalize(embedding[:n]), normalize(vector[:n])
+        if e is not None and v is not None:
+            out[position[book_id]] = e @ v
+    return out
+
+
+def build_index(db: Session, compress: bool = True) -> Optional[CatalogIndex]:
+    """Loads every book embedding from the DB into a new CatalogIndex."""
+    index = None
+    rows = db.query(models.Book.id, models.Book.embedding).filter(models.Book.embedding.isnot(None))
+    skipped = 0
+    for book_id, embedding in rows:
+        if embedding is None or len(embedding) == 0:
+            continue
+        if index is None:
+            index = CatalogIndex(dim=min(len(embedding), CATALOG_DIM) if CATALOG_DIM > 0 else len(embedding))
+        if not index.add(book_id, embedding):
+            skipped += 1
+    if skipped:
+        print(f"[WARNING] Catalog index skipped {skipped} books with invalid embeddings.")
+    if index is not None and compress:
+        _compress(index)
+    return index
+
+
+def _compress(index: CatalogIndex, previous: Optional[CatalogIndex] = None, meta: Optional[dict] = None):
+    """
+    Applies CATALOG_QUANTIZATION. When the index extends an already compressed `previous`
+    one, its quantizer and codes are reused and only the new rows are encoded; otherwise
+    the quantizer persisted for the store lineage is loaded (trained and saved once if missing).
+    """
+    if CATALOG_QUANTIZATION == "none":
+        return
+    if (previous is not None and previous.is_compressed and index.extends(previous)
+            and not _outgrown(previous.quantizer, index.size)):
+        index.compress(previous.quantizer, fit=False, codes=previous.codes)
+        return
+    before = index.nbytes
+    index.compress(_quantizer_for(index, meta), fit=False)
+    print(f"🗜️  Catalog compressed with {CATALOG_QUANTIZATION}: {before / 1e6:.1f} MB -> {index.nbytes / 1e6:.1f} MB")
+
+
+def _outgrown(quantizer, size: int) -> bool:
+    return size > quantizer.trained_rows * QUANTIZER_RETRAIN_GROWTH
+
+
+def _stored_quantizer(path: str, index: CatalogIndex):
+    try:
+        quantizer = quantization.load_quantizer(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if quantizer.dim != index.dim or _outgrown(quantizer, index.size):
+        return None
+    return quantizer
+
+
+def _quantizer_for(index: CatalogIndex, meta: Optional[dict]):
+    """
+    A quantizer trained on the index rows; shared through the store when there is one.
+    The stored one is retrained (geometrically, so rarely) when the catalog has outgrown it.
+    """
+    if meta is None:
+        return quantization.make_quantizer(CATALOG_QUANTIZATION, index.dim).fit(index.matrix)
+    path = embedding_store.quantizer_path(meta, CATALOG_QUANTIZATION)
+    quantizer = _stored_quantizer(path, index)
+    if quantizer is not None:
+        return quantizer
+    with embedding_store.writer_lock():  # One worker trains, the others load its result
+        quantizer = _stored_quantizer(path, index)
+        if quantizer is None:
+            start = time.time()
+            quantizer = quantization.make_quantizer(CATALOG_QUANTIZATION, index.dim).fit(index.matrix)
+            quantization.save_quantizer(quantizer, path)
+            print(f"✅  Trained {CATALOG_QUANTIZATION} quantizer on {index.size} books ({time.time() - start:.2f}s), saved to {path}")
+    return quantizer
+
+
+def _source_stats(db: Session) -> dict:
+    """What the published store must have been built from for it to be reused at startup."""
+    count, max_id = (
+        db.query(func.count(models.Book.id), func.max(models.Book.id))
+        .filter(models.Book.embedding.isnot(None))
+        .one()
+    )
+    return {"source_count": count, "source_max_id": max_id or 0, "catalog_dim": CATALOG_DIM}
+
+
+def _open_generation(meta: dict, previous: Optional[CatalogIndex] = None) -> CatalogIndex:
+    """Maps a published generation; work already done for `previous` (same lineage) is reused."""
+    ids, matrix, tail = embedding_store.open_generation(meta)
+    index = CatalogIndex.from_arrays(ids, matrix, tail, lineage=embedding_store.lineage(meta), previous=previous)
+    _compress(index, previous, meta)
+    return index
+
+
+def _load(db: Session):
+    """(index, generation): the published store when it is current, else a fresh build (published)."""
+    if not CATALOG_MMAP:
+        return build_index(db), None
+    stats = _source_stats(db)
+    meta = embedding_store.current_meta()
+    if meta is not None and all(meta.get(k) == v for k, v in stats.items()):
+        try:
+            return _open_generation(meta), _generation_key(meta)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Failed to open embedding store {meta.get('matrix')}: {e}")
+
+    index = build_index(db, compress=False)
+    if index is None:
+        return None, None
+    meta = embedding_store.publish(index.ids, index.matrix, **stats)
+    print(f"✅  Published catalog generation {meta['generation']} ({meta['count']} books) to {embedding_store.EMBEDDING_STORE_DIR}")
+    return _open_generation(meta), _generation_key(meta)
+
+
+def _generation_key(meta: dict):
+    return meta["matrix"], meta.get("generation")
+
+
+def _refresh():
+    """Swaps to a generation another worker published since we last looked (rate-limited)."""
+    global _index, _generation, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < CATALOG_STORE_POLL_SECONDS:
+        return
+    _checked_at = now
+    meta = embedding_store.current_meta()
+    if meta is None or _generation_key(meta) == _generation or meta.get("catalog_dim") != CATALOG_DIM:
+        return
+    with _lock:
+        if _generation_key(meta) == _generation:
+            return
+        try:
+            index = _open_generation(meta, previous=_index)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Failed to open embedding store {meta['matrix']}: {e}")
+            return
+        _index, _generation = index, _generation_key(meta)
+    rec_cache.bump_catalog()
+
+
+def get_index(db: Session) -> Optional[CatalogIndex]:
+    """Returns the process-wide index, opening (or building) it on first use."""
+    global _index, _generation
+    if _index is not None and _generation is not None:
+        _refresh()
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index, _generation = _load(db)
+    return _index
+
+
+def add_book(book: models.Book):
+    """Keeps an already-built index in sync with a newly created book."""
+    global _index, _generation
+    if book.embedding is None or len(book.embedding) == 0:
+        return
+    with _lock:
+        if _index is None:
+            # Not built yet: the first get_index() call will pick the book up from the DB.
+            return
+        if _generation is None:
+            _index.add(book.id, book.embedding)
+            return
+        # Shared store: publish a new generation with the book appended, then map it
+        v = prepare(book.embedding)
+        if v is None or v.shape[0] != _index.dim:
+            return
+        previous = embedding_store.current_meta() or {}
+        meta = embedding_store.append(
+            book.id, v,
+            source_count=previous.get("source_count", 0) + (0 if book.id in _index.row_of else 1),
+            source_max_id=max(previous.get("source_max_id", 0), book.id),
+        )
+        if meta is None:
+            _index.add(book.id, book.embedding)
+            return
+        _index, _generation = _open_generation(meta, previous=_index), _generation_key(meta)
+
+
+def peek() -> Optional[CatalogIndex]:
+    """The live index if one is loaded (no loading or store polling)."""
+    return _index
+
+
+
+class DerivedIndex:
+    """
+    Base for indexes keyed by catalog row (tag postings, facet columns, ANN lists).
+    Covers rows [0, synced) of `catalog`; sync() follows the catalog onto a newer
+    generation of the same lineage by adding only the rows it has not seen.
+    """
+    def __init__(self, catalog: Optional[CatalogIndex] = None):
+        self.catalog = catalog
+        self.synced = 0
+
+    def covers(self, catalog: CatalogIndex) -> bool:
+        """True when `catalog` is this index's catalog, or an older generation of it, and fully synced."""
+        return self.catalog is not None and self.catalog.extends(catalog) and self.synced >= catalog.size
+
+    def sync(self, db: Optional[Session], catalog: CatalogIndex):
+        self.catalog = catalog
+        self.add_rows(db, self.synced, catalog.size)
+        self.synced = catalog.size
+
+    def add_rows(self, db: Optional[Session], start: int, stop: int):
+        """Indexes catalog rows [start, stop). By default each book's Book.tags is passed to add()."""
+        ids = self.catalog.ids[start:stop].tolist()
+        for first in range(0, len(ids), 1000):
+            block = ids[first:first + 1000]
+            for book_id, tags in db.query(models.Book.id, models.Book.tags).filter(models.Book.id.in_(block)):
+                self.add(book_id, tags)
+
+    def add(self, book_id: int, tags):
+        raise NotImplementedError
+
+
+class DerivedIndexSlot:
+    """
+    The process-wide instance of one DerivedIndex kind. `build(db, catalog)` creates it
+    from scratch; a newer generation of the same store lineage is synced incrementally.
+    """
+    def __init__(self, build):
+        self._build = build
+        self._lock = threading.Lock()
+        self.index = None
+
+    def get(self, db: Optional[Session], catalog: Optional[CatalogIndex]):
+        if catalog is None:
+            return None
+        index = self.index
+        if index is not None and index.covers(catalog):
+            return index
+        with self._lock:
+            index = self.index
+            if index is not None and index.covers(catalog):
+                return index
+            if index is not None and catalog.extends(index.catalog):
+                index.sync(db, catalog)
+            else:
+                self.index = self._build(db, catalog)
+            return self.index
+
+    def follow(self, db: Optional[Session]):
+        """After a book was added: syncs an already built index onto the live catalog (never builds)."""
+        catalog = peek()
+        with self._lock:
+            if self.index is not None and catalog is not None and catalog.extends(self.index.catalog):
+                self.index.sync(db, catalog)
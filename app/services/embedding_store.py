@@ -0,0 +1,256 @@
+import glob
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+import numpy as np
+
+from ..database import DB_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer deployments only
+    fcntl = None
+
+# On-disk catalog embeddings shared by every API worker.
+# A generation is a base segment plus zero or more small delta segments, each a pair of
+# .npy files: the (n x d) float32 matrix of prepared (truncated + L2-normalized) vectors
+# and an int64 book id sidecar. Workers open the base matrix with mmap_mode="r", so the
+# OS page cache holds one copy for all processes and a restart does not re-read books.db;
+# the delta rows are small and read into memory. Writers never modify a published file:
+# a new book is written as a delta segment (O(d) bytes, not a copy of the matrix), and
+# every EMBEDDING_STORE_MAX_DELTAS appends the deltas are compacted into a new base.
+# The CURRENT pointer (a small JSON file) is replaced atomically; readers notice the new
+# generation on their next poll and swap (see catalog_index).
+#
+# Rows only ever get appended, in order, within a "lineage": every generation of a
+# lineage starts with the rows of the previous one, so readers can keep everything they
+# derived from those rows (quantizer codes, tag/facet/ANN indexes) and only add the new
+# ones. publish() and replacing an already stored book start a new lineage.
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", os.path.splitext(DB_PATH)[0] + ".catalog")
+EMBEDDING_STORE_KEEP = 2  # base segments kept on disk (older ones may still be mapped by slow readers)
+EMBEDDING_STORE_MAX_DELTAS = int(os.getenv("EMBEDDING_STORE_MAX_DELTAS", "64"))
+COPY_BLOCK_ROWS = 65536
+
+CURRENT = "CURRENT"
+
+
+def _path(name: str) -> str:
+    return os.path.join(EMBEDDING_STORE_DIR, name)
+
+
+@contextmanager
+def writer_lock():
+    """Serializes writers across processes so two appends can't publish from the same parent."""
+    os.makedirs(EMBEDDING_STORE_DIR, exist_ok=True)
+    with open(_path("LOCK"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _replace_atomic(tmp_path: str, path: str):
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def current_meta() -> Optional[dict]:
+    """The published generation ({"generation", "lineage", "matrix", "ids", "deltas", "count", "max_id", "dim", ...}), or None."""
+    try:
+        with open(_path(CURRENT), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_generation(meta: dict) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    (ids, read-only memory-mapped base matrix, in-memory delta rows or None) of a
+    published generation. ids cover the base rows followed by the delta rows.
+    """
+    ids = [np.load(_path(meta["ids"]))]
+    matrix = np.load(_path(meta["matrix"]), mmap_mode="r")
+    deltas = []
+    for delta in meta.get("deltas", []):
+        ids.append(np.load(_path(delta["ids"])))
+        deltas.append(np.load(_path(delta["matrix"])))
+    tail = np.concatenate(deltas) if deltas else None
+    return np.concatenate(ids), matrix, tail
+
+
+def lineage(meta: dict) -> str:
+    return meta.get("lineage", meta["matrix"])
+
+
+def _save_npy(name: str, array: np.ndarray):
+    tmp_path = _path(name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    _replace_atomic(tmp_path, _path(name))
+
+
+def _write_current(meta: dict):
+    current_tmp = _path(CURRENT + ".tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    _replace_atomic(current_tmp, _path(CURRENT))
+
+
+def _new_name(prefix: str, generation: int) -> str:
+    return f"{prefix}-{generation:06d}-{os.getpid()}-{int(time.time() * 1000)}"
+
+
+def _write_generation(ids: np.ndarray, blocks, dim: int, extra: dict, lineage_name: Optional[str] = None) -> dict:
+    """Writes a new base matrix from an iterator of row blocks, then publishes it (no deltas)."""
+    os.makedirs(EMBEDDING_STORE_DIR, exist_ok=True)
+    previous = current_meta()
+    generation = (previous or {}).get("generation", 0) + 1
+    name = _new_name("gen", generation)
+
+    _save_npy(name + ".ids.npy", np.asarray(ids, dtype=np.int64))
+
+    matrix_tmp = _path(name + ".npy.tmp")
+    out = np.lib.format.open_memmap(matrix_tmp, mode="w+", dtype=np.float32, shape=(len(ids), dim))
+    row = 0
+    for block in blocks:
+        out[row:row + block.shape[0]] = block
+        row += block.shape[0]
+    out.flush()
+    del out
+    _replace_atomic(matrix_tmp, _path(name + ".npy"))
+
+    meta = {
+        "generation": generation,
+        "lineage": lineage_name or name,
+        "matrix": name + ".npy",
+        "ids": name + ".ids.npy",
+        "deltas": [],
+        "count": int(len(ids)),
+        "max_id": int(ids.max()) if len(ids) else 0,
+        "dim": int(dim),
+        **extra,
+    }
+    _write_current(meta)
+    _remove_old_generations(meta)
+    return meta
+
+
+def publish(ids: np.ndarray, matrix: np.ndarray, **extra) -> dict:
+    """Publishes a complete catalog (rows already prepared) as a new generation and lineage."""
+    blocks = (matrix[start:start + COPY_BLOCK_ROWS] for start in range(0, matrix.shape[0], COPY_BLOCK_ROWS))
+    with writer_lock():
+        return _write_generation(ids, blocks, matrix.shape[1], extra)
+
+
+def append(book_id: int, vector: np.ndarray, **extra) -> Optional[dict]:
+    """
+    Publishes current generation + one book. Normally writes a one-row delta segment;
+    every EMBEDDING_STORE_MAX_DELTAS appends the deltas are compacted into a new base
+    (streamed in blocks, so memory stays bounded). Replacing a book that is already
+    stored rewrites the base in place of its row and starts a new lineage.
+    Returns None when nothing is published yet or the dimension does not match.
+    """
+    with writer_lock():
+        meta = current_meta()
+        if meta is None or meta["dim"] != vector.shape[0]:
+            return None
+        extra = {**meta_extra(meta), **extra}
+        # Ids are autoincrement: only an id not above max_id can already be stored
+        if book_id <= meta["max_id"]:
+            ids, matrix, tail = open_generation(meta)
+            existing = np.flatnonzero(ids == book_id)
+            if existing.size:
+                return _rewrite(ids, matrix, tail, existing, vector, extra, lineage_name=None)
+        if len(meta.get("deltas", [])) >= EMBEDDING_STORE_MAX_DELTAS:
+            ids, matrix, tail = open_generation(meta)
+            return _rewrite(np.append(ids, book_id), matrix, tail, np.empty(0, dtype=np.int64), vector,
+                            extra, lineage_name=lineage(meta), append_row=True)
+        return _write_delta(meta, book_id, vector, extra)
+
+
+def _write_delta(meta: dict, book_id: int, vector: np.ndarray, extra: dict) -> dict:
+    generation = meta["generation"] + 1
+    name = _new_name("delta", generation)
+    _save_npy(name + ".ids.npy", np.array([book_id], dtype=np.int64))
+    _save_npy(name + ".npy", np.asarray(vector, dtype=np.float32)[None, :])
+    new_meta = {
+        **meta,
+        "generation": generation,
+        "lineage": lineage(meta),
+        "deltas": meta.get("deltas", []) + [{"matrix": name + ".npy", "ids": name + ".ids.npy"}],
+        "count": meta["count"] + 1,
+        "max_id": max(meta["max_id"], int(book_id)),
+        **extra,
+    }
+    _write_current(new_meta)
+    return new_meta
+
+
+def _rewrite(ids: np.ndarray, matrix: np.ndarray, tail: Optional[np.ndarray], replace_rows: np.ndarray,
+             vector: np.ndarray, extra: dict, lineage_name: Optional[str], append_row: bool = False) -> dict:
+    """New base = old base + deltas (+ `vector` appended, or written over `replace_rows`)."""
+
+    def blocks():
+        for start in range(0, matrix.shape[0], COPY_BLOCK_ROWS):
+            block = np.array(matrix[start:start + COPY_BLOCK_ROWS])
+            hit = replace_rows[(replace_rows >= start) & (replace_rows < start + block.shape[0])]
+            block[hit - start] = vector
+            yield block
+        if tail is not None:
+            block = tail.copy()
+            hit = replace_rows[replace_rows >= matrix.shape[0]] - matrix.shape[0]
+            block[hit] = vector
+            yield block
+        if append_row:
+            yield vector[None, :]
+
+    return _write_generation(ids, blocks(), matrix.shape[1], extra, lineage_name=lineage_name)
+
+
+def meta_extra(meta: dict) -> dict:
+    """Caller-supplied fields of a meta dict (e.g. catalog_dim)."""
+    reserved = {"generation", "lineage", "matrix", "ids", "deltas", "count", "max_id", "dim"}
+    return {k: v for k, v in meta.items() if k not in reserved}
+
+
+def quantizer_path(meta: dict, method: str) -> str:
+    """Where the quantizer trained for this generation's lineage is persisted."""
+    return _path(f"quantizer-{lineage(meta)}-{method}.npz")
+
+
+def _remove_old_generations(meta: dict):
+    names = sorted(
+        {os.path.basename(p)[:-len(".ids.npy")] for p in glob.glob(_path("gen-*.ids.npy"))},
+        key=lambda n: int(n.split("-")[1]),
+    )
+    current = meta["matrix"][:-len(".npy")]
+    oldest_kept = min(int(n.split("-")[1]) for n in names[-EMBEDDING_STORE_KEEP:] + [current])
+    for name in names[:-EMBEDDING_STORE_KEEP]:
+        if name == current:
+            continue
+        _remove(name + ".npy", name + ".ids.npy")  # Mapped pages stay valid for readers that still hold them
+    # Deltas older than the oldest kept base belong to removed bases
+    for path in glob.glob(_path("delta-*.ids.npy")):
+        name = os.path.basename(path)[:-len(".ids.npy")]
+        if int(name.split("-")[1]) < oldest_kept:
+            _remove(name + ".npy", name + ".ids.npy")
+    # Readers of an older lineage already hold its quantizer in memory
+    for path in glob.glob(_path("quantizer-*.npz")):
+        name = os.path.basename(path)
+        if not name.startswith(f"quantizer-{meta['lineage']}-"):
+            _remove(name)
+
+
+def _remove(*names: str):
+    for name in names:
+        try:
+            os.remove(_path(name))
+        except OSError:
+            pass
@@ -0,0 +1,139 @@
+import os
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .. import models
+from .catalog_index import CatalogIndex, DerivedIndex, DerivedIndexSlot
+
+# Per-facet value arrays aligned with the catalog rows, built once from Book.tags.
+# A recommendation filter (max_violence=mild, max_age=15+, is_fiction=fiction, ...)
+# becomes a vectorized comparison over these arrays, and only the rows that pass are
+# scored, so filtered-out books are never touched and no tags JSON is read per request.
+#
+# Ordinal facets store the *highest* level any analysed chunk reported (conservative
+# for content warnings); categorical facets store the majority value. -1 = unknown.
+ORDINAL_FACETS = {
+    # filter name: (tags field, sub key, levels in increasing order)
+    "violence": ("content_warnings", "violence", ["none", "mild", "moderate", "severe"]),
+    "sexual_content": ("content_warnings", "sexual_content", ["none", "mild", "moderate", "explicit"]),
+    "abuse": ("content_warnings", "abuse", ["none", "mild", "moderate", "severe"]),
+    "self_harm": ("content_warnings", "self_harm", ["none", "mild", "moderate", "severe"]),
+    "drug_use": ("content_warnings", "drug_use", ["none", "mild", "moderate", "severe"]),
+    "discrimination": ("content_warnings", "discrimination", ["none", "mild", "moderate", "severe"]),
+    "age": ("age_rating_estimate", None, ["all", "12+", "15+", "19+"]),
+}
+CATEGORICAL_FACETS = {
+    "is_fiction": ["fiction", "non_fiction", "mixed"],
+    "target_audience": ["children", "YA", "adult", "all_age"],
+}
+UNKNOWN = -1
+# max_* filters are safety limits, so by default a book whose level is unknown (never tagged
+# for it) is excluded; FACET_UNKNOWN_PASSES=1 lets such books through instead
+FACET_UNKNOWN_PASSES = os.getenv("FACET_UNKNOWN_PASSES", "0") == "1"
+
+
+def _votes(value) -> Dict[str, float]:
+    """Aggregated {value: count} votes; un-aggregated single values count once."""
+    if isinstance(value, dict):
+        return {str(k): c for k, c in value.items() if isinstance(c, (int, float)) and c > 0}
+    if isinstance(value, (str, int, float)):
+        return {str(value): 1}
+    return {}
+
+
+def book_facets(tags) -> Dict[str, int]:
+    """Facet name -> level/category index (UNKNOWN when absent) for one book's tags."""
+    facets = {}
+    if not isinstance(tags, dict):
+        tags = {}
+    for name, (field, key, levels) in ORDINAL_FACETS.items():
+        value = tags.get(field)
+        if key is not None:
+            value = value.get(key) if isinstance(value, dict) else None
+        found = [levels.index(v) for v in _votes(value) if v in levels]
+        facets[name] = max(found) if found else UNKNOWN
+    for name, values in CATEGORICAL_FACETS.items():
+        votes = {v: c for v, c in _votes(tags.get(name)).items() if v in values}
+        facets[name] = values.index(max(votes, key=votes.get)) if votes else UNKNOWN
+    return facets
+
+
+def parse_filters(params: Dict[str, Optional[str]]) -> Dict[str, int]:
+    """
+    Validates request filters ({"max_violence": "mild", "is_fiction": "fiction", ...})
+    into facet -> index. Raises ValueError with a user-facing message.
+    """
+    parsed = {}
+    for param, value in params.items():
+        if value is None:
+            continue
+        if param.startswith("max_") and param[4:] in ORDINAL_FACETS:
+            name, levels = param[4:], ORDINAL_FACETS[param[4:]][2]
+        elif param in CATEGORICAL_FACETS:
+            name, levels = param, CATEGORICAL_FACETS[param]
+        else:
+            raise ValueError(f"Unknown filter: {param}")
+        if value not in levels:
+            raise ValueError(f"{param} must be one of: {', '.join(levels)}")
+        parsed[name] = levels.index(value)
+    return parsed
+
+
+class FacetIndex(DerivedIndex):
+    def __init__(self, catalog: CatalogIndex):
+        super().__init__(catalog)
+        self.columns = {name: np.full(0, UNKNOWN, dtype=np.int8) for name in list(ORDINAL_FACETS) + list(CATEGORICAL_FACETS)}
+
+    def _ensure(self, size: int):
+        for name, column in self.columns.items():
+            if column.shape[0] < size:
+                grown = np.full(max(size, 2 * column.shape[0]), UNKNOWN, dtype=np.int8)
+                grown[:column.shape[0]] = column
+                self.columns[name] = grown
+
+    def add_rows(self, db: Session, start: int, stop: int):
+        self._ensure(stop)
+        super().add_rows(db, start, stop)
+
+    def add(self, book_id: int, tags):
+        row = self.catalog.row_of.get(book_id)
+        if row is None:
+            return
+        self._ensure(row + 1)
+        for name, value in book_facets(tags).items():
+            self.columns[name][row] = value
+
+    def mask(self, filters: Dict[str, int], size: int) -> np.ndarray:
+        """Boolean mask over the first `size` catalog rows of the books passing every filter."""
+        self._ensure(size)
+        keep = np.ones(size, dtype=bool)
+        for name, limit in filters.items():
+            column = self.columns[name][:size]
+            if name in ORDINAL_FACETS:
+                passed = column <= limit
+                passed &= (column != UNKNOWN) | FACET_UNKNOWN_PASSES
+            else:
+                passed = column == limit
+            keep &= passed
+        return keep
+
+
+def build_index(db: Session, catalog: CatalogIndex) -> FacetIndex:
+    index = FacetIndex(catalog)
+    index.sync(db, catalog)
+    return index
+
+
+_facet_index = DerivedIndexSlot(build_index)
+
+
+def get_index(db: Session, catalog: Optional[CatalogIndex]) -> Optional[FacetIndex]:
+    """Returns the process-wide facet index for the catalog (see DerivedIndexSlot)."""
+    return _facet_index.get(db, catalog)
+
+
+def add_book(db: Session, book: models.Book):
+    """Adds a newly created (and already catalog-indexed) book's facets, and any other new catalog rows."""
+    _facet_index.follow(db)
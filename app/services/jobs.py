@@ -0,0 +1,143 @@
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from .. import crud, schemas
+from ..database import SessionLocal
+from . import analysis
+
+# Background EPUB analysis. /books/upload only stores the file and an AnalysisJob row,
+# then hands the job to this pool; the request returns 202 immediately and the event
+# loop never waits on the LLM / embedding calls. Each stage transition is committed to
+# the job row so GET /jobs/{id} can report progress, and the Book row is written once
+# the analysis has finished.
+# Jobs live in the submitting process, so a restart orphans its queued/running jobs.
+# Running jobs touch their row on every progress report (per chunk while tagging), so a
+# job not updated for ANALYSIS_JOB_STALE_SECONDS is treated as orphaned: duplicate
+# uploads no longer attach to it, and it is marked failed at the next server start.
+# (Staleness rather than "everything unfinished" keeps other API workers' jobs alive.)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_JOB_STALE_SECONDS = float(os.getenv("ANALYSIS_JOB_STALE_SECONDS", "1800"))
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+    return _executor
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _update(job_id: str, **fields):
+    db = SessionLocal()
+    try:
+        db_job = crud.get_analysis_job(db, job_id)
+        if db_job is None:
+            return
+        for key, value in fields.items():
+            setattr(db_job, key, value)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _report_stage(job_id: str, stage: str, state: str, detail: Optional[str] = None):
+    db = SessionLocal()
+    try:
+        db_job = crud.get_analysis_job(db, job_id)
+        if db_job is None:
+            return
+        stages = dict(db_job.stages or {})  # New dict so the JSON column is flagged dirty
+        entry = dict(stages.get(stage) or {})
+        if state == "running" and entry.get("status") != "running":
+            entry["started_at"] = _now()
+        if state == "done":
+            entry["finished_at"] = _now()
+        entry["status"] = state
+        if detail is not None:
+            entry["detail"] = detail
+        stages[stage] = entry
+        db_job.stages = stages
+        db_job.stage = stage
+        db.commit()
+    finally:
+        db.close()
+
+
+def _run(job_id: str):
+    db = SessionLocal()
+    try:
+        db_job = crud.get_analysis_job(db, job_id)
+        if db_job is None:
+            return
+        title, author, file_path, content_hash = db_job.title, db_job.author, db_job.file_path, db_job.content_hash
+    finally:
+        db.close()
+
+    _update(job_id, status="running")
+    try:
+        result = analysis.analyze_epub(
+            file_path,
+            progress=lambda stage, state, detail=None: _report_stage(job_id, stage, state, detail),
+        )
+        db = SessionLocal()
+        try:
+            book = schemas.BookCreate(
+                title=title,
+                author=author,
+                description=result.get("description"),
+                tags=result.get("tags"),
+                embedding=result.get("embedding"),
+                content_hash=content_hash,
+            )
+            try:
+                book_id = crud.create_book(db=db, book=book).id
+            except IntegrityError:
+                # Same file finished first in another job (reuse upload, or a race between two
+                # uploads); the hash stays on that book and this one is stored without it
+                db.rollback()
+                book.content_hash = None
+                book_id = crud.create_book(db=db, book=book).id
+        finally:
+            db.close()
+        _update(job_id, status="succeeded", book_id=book_id)
+        print(f"✅ Job {job_id}: book {book_id} created")
+    except Exception as e:
+        traceback.print_exc()
+        print(f"❌ Job {job_id} failed: {e}")
+        _update(job_id, status="failed", error=str(e))
+
+
+def stale_before() -> datetime:
+    """Jobs last updated before this (naive UTC, like the DB timestamps) are considered orphaned."""
+    return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=ANALYSIS_JOB_STALE_SECONDS)
+
+
+def fail_orphaned_jobs() -> int:
+    """Called at startup: marks stale queued/running jobs (left by a previous run) as failed."""
+    db = SessionLocal()
+    try:
+        count = crud.fail_stale_analysis_jobs(db, stale_before(), "Interrupted (server restarted); upload the file again.")
+    finally:
+        db.close()
+    if count:
+        print(f"[WARNING] Marked {count} orphaned analysis jobs as failed (interrupted by a restart).")
+    return count
+
+
+def submit(job_id: str):
+    """Queues an already created AnalysisJob for background processing."""
+    _get_executor().submit(_run, job_id)
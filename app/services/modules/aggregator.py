@@ -35,36 +35,15 @@ def recursive_merge(summary, data):
         # 최상위가 리스트인 경우는 잘 없지만 처리 (단순 리스트 병합은 아님, 여기선 구조상 dict 안의 list로 처리됨)
         pass
 
-def aggregate_tags(tag_dir, output_dir, file_prefix):
+def aggregate(tag_list):
     """
-    tag_dir 내의 부분 태그 파일들을 읽어 통합된 카운트 정보를 output_dir에 저장합니다.
+    부분 태그 dict 리스트를 메모리에서 통합된 카운트 정보(dict)로 집계합니다.
+    구조: { "field_name": { "value1": count, "value2": count }, "nested_field": { "sub_field": { "value": count } } }
     """
-    print(f"    -> Aggregating tags from {tag_dir}...")
-    
-    # 1. 파일 목록 수집
-    tag_files = [f for f in os.listdir(tag_dir) if f.endswith(".json") and "_tag_" in f and not f.endswith("_tag_all.json")]
-    
-    if not tag_files:
-        print("    -> No tag files found to aggregate.")
-        return
-
-    # 2. 데이터 집계
-    # 구조: { "field_name": { "value1": count, "value2": count }, "nested_field": { "sub_field": { "value": count } } }
     aggregated_data = {}
 
-    for tag_file in tag_files:
-        file_path = os.path.join(tag_dir, tag_file)
+    for i, data in enumerate(tag_list):
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            # 재귀적으로 데이터 병합
-            # aggregated_data는 동적으로 구조가 잡혀야 함.
-            # 편의상 직접 구현보다는, 위에서 정의한 recursive_merge 사용
-            # 하지만 defaultdict와 dict가 섞이면 나중에 json dump할 때 문제될 수 있음.
-            # 따라서 dict로 변환하는 과정이 필요하거나, 처음부터 dict로 관리.
-            
-            # 간단한 구현:
             for key, value in data.items():
                 if key not in aggregated_data:
                     aggregated_data[key] = defaultdict(int)
@@ -86,25 +65,43 @@ def aggregate_tags(tag_dir, output_dir, file_prefix):
                     # 문자열/숫자 등
                     aggregated_data[key][value] += 1
 
+        except Exception as e:
+            print(f"    [WARNING] Failed to process tag #{i}: {e}")
+
+    # defaultdict를 (중첩된 것까지) 일반 dict로 변환
+    return _to_dict(aggregated_data)
+
+def _to_dict(value):
+    if isinstance(value, dict):
+        return {key: _to_dict(sub_value) for key, sub_value in value.items()}
+    return value
+
+def aggregate_tags(tag_dir, output_dir, file_prefix):
+    """
+    tag_dir 내의 부분 태그 파일들을 읽어 통합된 카운트 정보를 output_dir에 저장합니다.
+    """
+    print(f"    -> Aggregating tags from {tag_dir}...")
+    
+    # 1. 파일 목록 수집
+    tag_files = [f for f in os.listdir(tag_dir) if f.endswith(".json") and "_tag_" in f and not f.endswith("_tag_all.json")]
+    
+    if not tag_files:
+        print("    -> No tag files found to aggregate.")
+        return
+
+    # 2. 데이터 로드 후 집계
+    tag_list = []
+    for tag_file in tag_files:
+        file_path = os.path.join(tag_dir, tag_file)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                tag_list.append(json.load(f))
         except Exception as e:
             print(f"    [WARNING] Failed to process {tag_file}: {e}")
 
-    # 3. defaultdict를 일반 dict로 변환 (JSON 직렬화 위해)
-    final_data = {}
-    for key, value in aggregated_data.items():
-        if isinstance(value, defaultdict):
-            final_data[key] = dict(value)
-        elif isinstance(value, dict):
-            final_data[key] = {}
-            for sub_key, sub_value in value.items():
-                if isinstance(sub_value, defaultdict):
-                    final_data[key][sub_key] = dict(sub_value)
-                else:
-                    final_data[key][sub_key] = sub_value
-        else:
-            final_data[key] = value
+    final_data = aggregate(tag_list)
 
-    # 4. 결과 저장
+    # 3. 결과 저장
     os.makedirs(output_dir, exist_ok=True)
     output_filename = f"{file_prefix}_tag_all.json"
     output_path = os.path.join(output_dir, output_filename)
@@ -108,9 +108,12 @@ def chapters_to_text(chapters: List[Dict[str, Any]]) -> str:
             out_lines.append("")
     return "\n".join(out_lines).strip() + "\n"
 
+def epub_to_text(epub_path: str) -> str:
+    """Convert an epub to text in memory."""
+    return chapters_to_text(extract_epub(epub_path))
+
 def convert_epub_to_txt(epub_path: str, output_path: str):
     """Convenience function to convert epub to txt file."""
-    chapters = extract_epub(epub_path)
-    text = chapters_to_text(chapters)
+    text = epub_to_text(epub_path)
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(text)
@@ -0,0 +1,213 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# GMS 게이트웨이 호출용 공유 HTTP 클라이언트.
+# 하나의 requests.Session을 프로세스 전체에서 재사용하므로 keep-alive 연결 풀 덕분에
+# 호출마다 TCP/TLS 핸드셰이크를 새로 하지 않음. tagger와 vectorizer가 모두 이 모듈을 통해 요청함.
+# 요청 전에 프로세스 공용 토큰 버킷(분당 요청 수/토큰 수)에서 할당량을 받고,
+# 429/5xx/연결 오류는 Retry-After 또는 지수 백오프(+jitter) 후 재시도함.
+load_dotenv()
+GMS_KEY = os.getenv("GMS_KEY")
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))  # LLM 응답은 수십 초 걸릴 수 있음
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))  # 동시 태깅 수(TAG_CONCURRENCY)보다 크게
+
+# 게이트웨이 할당량 (0 = 제한 없음)
+GMS_REQUESTS_PER_MINUTE = int(os.getenv("GMS_REQUESTS_PER_MINUTE", "0"))
+GMS_TOKENS_PER_MINUTE = int(os.getenv("GMS_TOKENS_PER_MINUTE", "0"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1.0"))  # 초, 시도마다 2배
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "60"))
+
+_session = None
+_lock = threading.Lock()
+_latency_hooks = []
+
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    입력 텍스트의 토큰 수 추정. tiktoken이 있으면 정확히 세고,
+    없으면 UTF-8 바이트 수 / 2로 넉넉하게 추정 (한글 1글자 = 3바이트 ≈ 1.5토큰).
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text.encode("utf-8")) // 2 + 1
+
+
+class TokenBucket:
+    """
+    분당 per_minute만큼 연속적으로 채워지는 버킷. acquire(n)은 n만큼 쌓일 때까지 대기.
+    버킷 용량보다 큰 요청은 버킷이 가득 찼을 때 통과시키고 잔량을 음수로 만들어 이후 요청을 늦춤.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        if self.capacity <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                needed = min(amount, self.capacity)
+                if self.level >= needed:
+                    self.level -= amount
+                    return
+                wait = (needed - self.level) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """요청 수/토큰 수 버킷 + 429 Retry-After로 모든 스레드를 함께 멈추는 공용 대기 시각."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    def acquire(self, tokens: int = 0):
+        while True:
+            with self.lock:
+                wait = self.resume_at - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        self.requests.acquire(1)
+        if tokens:
+            self.tokens.acquire(tokens)
+
+
+limiter = RateLimiter(GMS_REQUESTS_PER_MINUTE, GMS_TOKENS_PER_MINUTE)
+
+
+def add_latency_hook(hook):
+    """
+    요청이 끝날 때마다 hook(method, url, status_code, elapsed_seconds, error)를 호출하도록 등록.
+    예외로 끝난 요청은 status_code=None, error=예외 객체.
+    """
+    _latency_hooks.append(hook)
+
+
+def remove_latency_hook(hook):
+    if hook in _latency_hooks:
+        _latency_hooks.remove(hook)
+
+
+def get_session() -> requests.Session:
+    """연결 풀과 공통 헤더가 설정된 공유 세션 (최초 호출 시 생성)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {GMS_KEY}",
+                })
+                _session = session
+    return _session
+
+
+def _notify(method, url, status_code, elapsed, error):
+    for hook in list(_latency_hooks):
+        try:
+            hook(method, url, status_code, elapsed, error)
+        except Exception as e:
+            print(f"[WARNING] Latency hook failed: {e}")
+
+
+def backoff_delay(attempt: int) -> float:
+    """지수 백오프 + full jitter: 0 ~ min(max, base * 2^attempt) 사이 임의의 초."""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+
+def retry_after_seconds(res):
+    """Retry-After(초 또는 HTTP 날짜) / retry-after-ms 헤더를 초로 변환. 없으면 None."""
+    value = res.headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+    value = res.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def post(url, json=None, timeout=None, tokens=0, **kwargs) -> requests.Response:
+    """
+    공유 세션으로 POST. timeout 미지정 시 (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT) 사용.
+    tokens: 이 요청이 소모할 추정 토큰 수 (분당 토큰 한도 계산용).
+    429/5xx/연결 오류는 HTTP_MAX_RETRIES번까지 재시도하고, 마지막 응답(또는 예외)을 그대로 돌려줌.
+    """
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        limiter.acquire(tokens)
+        start = time.perf_counter()
+        try:
+            res = get_session().post(url, json=json, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _notify("POST", url, None, time.perf_counter() - start, e)
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"[WARNING] {e.__class__.__name__} on {url}, retrying in {delay:.1f}s ({attempt + 1}/{HTTP_MAX_RETRIES})")
+            time.sleep(delay)
+            continue
+        except Exception as e:
+            _notify("POST", url, None, time.perf_counter() - start, e)
+            raise
+        _notify("POST", url, res.status_code, time.perf_counter() - start, None)
+
+        if res.status_code != 429 and res.status_code < 500:
+            return res
+        if attempt == HTTP_MAX_RETRIES:
+            return res
+        retry_after = retry_after_seconds(res)
+        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+        if res.status_code == 429:
+            limiter.pause(delay)  # 할당량 초과는 프로세스 전체가 함께 쉼
+        print(f"[WARNING] HTTP {res.status_code} on {url}, retrying in {delay:.1f}s ({attempt + 1}/{HTTP_MAX_RETRIES})")
+        time.sleep(delay)
+    return res
@@ -0,0 +1,149 @@
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from . import catalog_index
+
+# User profile vectors are maintained incrementally as a weighted running sum of
+# book embeddings (see crud.create_or_update_user_book), so reading a profile is a
+# single row lookup: profile = vector_sum / weight_sum.
+#
+# Weighting schemes (PROFILE_WEIGHTING):
+#  - "uniform":  every shelved book counts 1.0 (plain mean of the embeddings)
+#  - "weighted": rating x status weights; dropped books get a negative weight and
+#                push the profile *away* from them
+# PROFILE_HALF_LIFE_DAYS > 0 additionally decays each book by the age of its
+# last_read_at. Decay changes with the clock, so decayed profiles are computed per
+# request (weighted_profile) instead of being read from the stored running sum.
+# Both paths sum books in their catalog form (book_vector: truncated to CATALOG_DIM and
+# unit-norm, like the rows decayed_profiles reads from the index), so they rank alike.
+PROFILE_WEIGHTING = os.getenv("PROFILE_WEIGHTING", "weighted")
+PROFILE_HALF_LIFE_DAYS = float(os.getenv("PROFILE_HALF_LIFE_DAYS", "0"))  # 0 disables time decay
+
+RATING_WEIGHTS = {1: -0.5, 2: 0.0, 3: 0.5, 4: 1.0, 5: 1.5}
+UNRATED_WEIGHT = 1.0
+STATUS_WEIGHTS = {"finished": 1.0, "reading": 0.75}
+DROPPED_WEIGHT = float(os.getenv("PROFILE_DROPPED_WEIGHT", "-0.5"))
+
+# Lookup table indexed by rating (index 0 = unrated / out of range)
+_RATING_TABLE = np.array(
+    [UNRATED_WEIGHT] + [RATING_WEIGHTS[r] for r in range(1, 6)], dtype=np.float32
+)
+
+
+def scheme() -> str:
+    """Identifies the weights and vector form baked into a stored running sum; profiles built under another scheme are rebuilt."""
+    form = f"unit:{catalog_index.CATALOG_DIM}"
+    if PROFILE_WEIGHTING == "uniform":
+        return f"uniform:{form}"
+    return f"weighted:{sorted(RATING_WEIGHTS.items())}:{sorted(STATUS_WEIGHTS.items())}:{DROPPED_WEIGHT}:{form}"
+
+
+def book_vector(embedding) -> Optional[np.ndarray]:
+    """A book's contribution to a profile: its embedding in catalog form (None if unusable)."""
+    return catalog_index.prepare(embedding)
+
+
+def compute_weights(ratings: Sequence, statuses: Sequence, last_read_at: Optional[Sequence] = None,
+                    now: Optional[datetime] = None, half_life_days: float = 0.0) -> np.ndarray:
+    """
+    Weights of many shelf entries at once. `ratings` may contain None; `last_read_at`
+    is only used when half_life_days > 0 (entries without a timestamp are not decayed).
+    """
+    n = len(statuses)
+    if PROFILE_WEIGHTING == "uniform":
+        weights = np.ones(n, dtype=np.float32)
+    else:
+        r = np.array([x if x is not None else 0 for x in ratings], dtype=np.int64)
+        r[(r < 1) | (r > 5)] = 0
+        weights = _RATING_TABLE[r] * np.array([STATUS_WEIGHTS.get(s, 1.0) for s in statuses], dtype=np.float32)
+        dropped = np.array([s == "dropped" for s in statuses], dtype=bool)
+        weights[dropped] = DROPPED_WEIGHT
+
+    if half_life_days > 0 and last_read_at is not None and n:
+        now = now or datetime.now(timezone.utc)
+        ages = np.array([_age_days(t, now) for t in last_read_at], dtype=np.float64)
+        weights = (weights * np.exp2(-np.maximum(ages, 0.0) / half_life_days)).astype(np.float32)
+    return weights
+
+
+def _age_days(timestamp, now: datetime) -> float:
+    if timestamp is None:
+        return 0.0
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)  # SQLite returns naive UTC
+    return (now - timestamp).total_seconds() / 86400.0
+
+
+def shelf_weights(signals, now: Optional[datetime] = None) -> Dict[int, float]:
+    """{book_id: weight} of one user's crud.get_user_book_signals rows, decayed like the vector profile."""
+    if not signals:
+        return {}
+    _, book_ids, ratings, statuses, times = zip(*signals)
+    weights = compute_weights(ratings, statuses, times, now=now, half_life_days=PROFILE_HALF_LIFE_DAYS)
+    return dict(zip(book_ids, weights.tolist()))
+
+
+def book_weight(user_book) -> float:
+    """Contribution weight of one shelf entry to the stored (undecayed) profile vector."""
+    if user_book is None:
+        return 0.0
+    return float(compute_weights([user_book.rating], [user_book.status])[0])
+
+
+def weighted_profile(vectors: np.ndarray, weights: np.ndarray) -> Optional[np.ndarray]:
+    """weights @ vectors / sum(|weights|): the whole profile as one stacked-matrix product."""
+    if vectors is None or len(weights) == 0:
+        return None
+    norm = float(np.abs(weights).sum())
+    if norm <= 0:
+        return None
+    return (np.asarray(weights, dtype=np.float32) @ vectors) / norm
+
+
+def decayed_profiles(catalog, signals, now: Optional[datetime] = None) -> Dict[int, np.ndarray]:
+    """
+    Time-decayed profile vectors from crud.get_user_book_signals rows, one stacked
+    product per user over the catalog's in-memory vectors (no embeddings are read from the DB).
+    """
+    by_user = {}
+    for user_id, book_id, rating, status, last_read_at in signals:
+        row = catalog.row_of.get(book_id)
+        if row is not None:
+            by_user.setdefault(user_id, []).append((row, rating, status, last_read_at))
+    now = now or datetime.now(timezone.utc)
+    out = {}
+    for user_id, entries in by_user.items():
+        rows, ratings, statuses, times = zip(*entries)
+        weights = compute_weights(ratings, statuses, times, now=now, half_life_days=PROFILE_HALF_LIFE_DAYS)
+        vector = weighted_profile(catalog.vectors(np.asarray(rows, dtype=np.int64)), weights)
+        if vector is not None:
+            out[user_id] = vector
+    return out
+
+
+def apply_delta(vector_sum, embedding, delta: float) -> Optional[np.ndarray]:
+    """
+    vector_sum + delta * embedding in O(d), tolerating an empty profile.
+    `embedding` is a book_vector(). Mixed dimensions (reduced-dimension books) are summed on their shared prefix,
+    which is exact because truncation commutes with summation.
+    """
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if vector_sum is None or len(vector_sum) == 0:
+        return (delta * embedding).astype(np.float32)
+    n = min(len(vector_sum), len(embedding))
+    return (np.asarray(vector_sum[:n], dtype=np.float32) + delta * embedding[:n]).astype(np.float32)
+
+
+def profile_vector(profile) -> Optional[np.ndarray]:
+    """
+    Weighted mean vector of a UserProfile row (None when it carries no weight).
+    weight_sum holds sum(|w|), so negative (dropped) weights never flip the sign.
+    """
+    if profile is None or profile.vector_sum is None or not profile.weight_sum:
+        return None
+    if profile.weight_sum <= 0:
+        return None
+    return np.asarray(profile.vector_sum, dtype=np.float32) / profile.weight_sum
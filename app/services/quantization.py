@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+
+# Compressed storage for L2-normalized catalog embeddings.
+#  - Int8Quantizer: per-dimension symmetric scalar quantization, 1 byte/dim (4x smaller).
+#  - ProductQuantizer: splits vectors into 8-dim sub-vectors and stores the id of the
+#    nearest of 256 sub-centroids, 1 byte per sub-vector (3072 dims -> 384 B, 32x smaller).
+# Both score a float32 query directly against the codes, without decompressing the catalog.
+SCORE_BLOCK_ROWS = 16384  # bounds the float32 temporaries created while scoring
+
+
+class Int8Quantizer:
+    code_dtype = np.int8
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.scale = np.ones(dim, dtype=np.float32)
+        self.trained_rows = 0
+
+    def code_width(self) -> int:
+        return self.dim
+
+    def fit(self, matrix: np.ndarray):
+        peak = np.abs(matrix).max(axis=0) if matrix.shape[0] else np.ones(self.dim)
+        peak = np.where(peak > 0, peak, 1.0)
+        self.scale = (peak / 127.0).astype(np.float32)
+        self.trained_rows = matrix.shape[0]
+        return self
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        matrix = np.atleast_2d(matrix)
+        return np.clip(np.rint(matrix / self.scale), -127, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.atleast_2d(codes).astype(np.float32) * self.scale
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # q . (codes * scale) == (q * scale) . codes
+        scaled = (query * self.scale).astype(np.float32)
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + block.shape[0]] = block.astype(np.float32) @ scaled
+        return out
+
+
+class ProductQuantizer:
+    code_dtype = np.uint8
+
+    def __init__(self, dim: int, sub_dim: int = 8, n_centroids: int = 256):
+        if dim % sub_dim != 0:
+            sub_dim = next(s for s in range(sub_dim, 0, -1) if dim % s == 0)
+        self.dim = dim
+        self.sub_dim = sub_dim
+        self.n_sub = dim // sub_dim
+        self.n_centroids = n_centroids
+        self.centroids = np.zeros((self.n_sub, n_centroids, sub_dim), dtype=np.float32)
+        self.trained_rows = 0
+
+    def code_width(self) -> int:
+        return self.n_sub
+
+    def _split(self, matrix: np.ndarray) -> np.ndarray:
+        # (n, dim) -> (n_sub, n, sub_dim)
+        return np.atleast_2d(matrix).reshape(-1, self.n_sub, self.sub_dim).transpose(1, 0, 2)
+
+    def fit(self, matrix: np.ndarray, n_iter: int = 12, sample_size: int = 50000, seed: int = 42):
+        self.trained_rows = matrix.shape[0]
+        rng = np.random.default_rng(seed)
+        if matrix.shape[0] > sample_size:
+            matrix = matrix[rng.choice(matrix.shape[0], sample_size, replace=False)]
+        ks = min(self.n_centroids, matrix.shape[0])
+        subs = self._split(matrix)
+        for j in range(self.n_sub):
+            x = subs[j]
+            c = x[rng.choice(x.shape[0], ks, replace=False)].copy()
+            for _ in range(n_iter):
+                assign = _nearest(x, c)
+                counts = np.bincount(assign, minlength=ks).astype(np.float32)
+                sums = np.zeros_like(c)
+                np.add.at(sums, assign, x)
+                filled = counts > 0
+                c[filled] = sums[filled] / counts[filled, None]
+            self.centroids[j, :ks] = c
+            if ks < self.n_centroids:
+                self.centroids[j, ks:] = c[0]
+        return self
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        subs = self._split(matrix)
+        codes = np.empty((subs.shape[1], self.n_sub), dtype=np.uint8)
+        for j in range(self.n_sub):
+            codes[:, j] = _nearest(subs[j], self.centroids[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        codes = np.atleast_2d(codes)
+        parts = [self.centroids[j][codes[:, j]] for j in range(self.n_sub)]
+        return np.concatenate(parts, axis=1)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # Asymmetric distance computation: one (n_sub x 256) lookup table per query,
+        # then every book's score is the sum of n_sub table entries.
+        table = np.einsum("jkd,jd->jk", self.centroids, self._split(query)[:, 0, :])
+        flat = table.ravel()
+        offsets = (np.arange(self.n_sub) * self.n_centroids).astype(np.int64)
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + block.shape[0]] = flat[block.astype(np.int64) + offsets].sum(axis=1)
+        return out
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    c_norms = (centroids * centroids).sum(axis=1)
+    out = np.empty(x.shape[0], dtype=np.int64)
+    for start in range(0, x.shape[0], block):
+        xb = x[start:start + block]
+        out[start:start + block] = np.argmin(c_norms - 2.0 * (xb @ centroids.T), axis=1)
+    return out
+
+
+def make_quantizer(method: str, dim: int):
+    if method == "int8":
+        return Int8Quantizer(dim)
+    if method == "pq":
+        return ProductQuantizer(dim)
+    raise ValueError(f"Unknown quantization method: {method}")
+
+
+def save_quantizer(quantizer, path: str):
+    """Persists a trained quantizer (atomically) so other workers and restarts reuse it."""
+    if isinstance(quantizer, Int8Quantizer):
+        state = {"method": "int8", "scale": quantizer.scale}
+    else:
+        state = {"method": "pq", "centroids": quantizer.centroids}
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, dim=quantizer.dim, trained_rows=quantizer.trained_rows, **state)
+    os.replace(tmp_path, path)
+
+
+def load_quantizer(path: str):
+    data = np.load(path)
+    method, dim = str(data["method"]), int(data["dim"])
+    quantizer = make_quantizer(method, dim)
+    quantizer.trained_rows = int(data["trained_rows"])
+    if method == "int8":
+        quantizer.scale = data["scale"].astype(np.float32)
+    else:
+        centroids = data["centroids"].astype(np.float32)
+        quantizer.n_sub, quantizer.n_centroids, quantizer.sub_dim = centroids.shape
+        quantizer.centroids = centroids
+    return quantizer
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+# LRU + TTL cache for recommendation responses.
+# Every entry remembers the (user generation, catalog generation) it was computed
+# under, so it is only served while nothing it depends on has changed. The user
+# generation is users.shelf_version, bumped by crud in the same transaction as the
+# shelf write, so a write on one API worker invalidates every worker's entries.
+# The catalog counter is per process and is bumped when this worker's catalog
+# index changes (its own new books, or a store generation published by another worker,
+# which the recommendations endpoint polls for before every cache lookup).
+REC_CACHE_MAX_ENTRIES = int(os.getenv("REC_CACHE_MAX_ENTRIES", "10000"))
+REC_CACHE_TTL_SECONDS = float(os.getenv("REC_CACHE_TTL_SECONDS", "600"))
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (expires_at, generations, value)
+_catalog_generation = 0
+
+
+def generations(shelf_version: int) -> Tuple[int, int]:
+    """Snapshot to take *before* computing a result that will be stored with put()."""
+    return shelf_version, _catalog_generation
+
+
+def get(key: Tuple, gens: Tuple[int, int]) -> Optional[Any]:
+    """The entry for `key` if it was computed under `gens` (the current generations())."""
+    if REC_CACHE_MAX_ENTRIES <= 0:
+        return None
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        expires_at, entry_gens, value = entry
+        if expires_at < time.monotonic() or entry_gens != gens:
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return value
+
+
+def put(key: Tuple, value: Any, gens: Tuple[int, int]):
+    """Stores a result computed under `gens`."""
+    if REC_CACHE_MAX_ENTRIES <= 0:
+        return
+    with _lock:
+        if gens[1] != _catalog_generation:
+            return  # The catalog changed while we were computing (shelf writes are caught by get())
+        _entries[key] = (time.monotonic() + REC_CACHE_TTL_SECONDS, gens, value)
+        _entries.move_to_end(key)
+        while len(_entries) > REC_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def bump_catalog():
+    global _catalog_generation
+    with _lock:
+        _catalog_generation += 1
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,89 @@
+import os
+from typing import List
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .. import models
+from . import catalog_index, ranking
+from .catalog_index import CatalogIndex
+
+# Item-to-item kNN graph persisted in the book_neighbors table (top SIMILAR_TOP_N per book).
+# build_table() recomputes it offline in blocked (block x catalog) matrix products;
+# add_book() inserts a new upload's own neighbours and enters it into the lists of the
+# books it is close to. Serving /books/{id}/similar is then one indexed range read.
+SIMILAR_TOP_N = int(os.getenv("SIMILAR_TOP_N", "50"))
+SIMILAR_BLOCK_ROWS = int(os.getenv("SIMILAR_BLOCK_ROWS", "1024"))  # block x N float32 scores per step
+SIMILAR_REVERSE_CANDIDATES = 4  # x top_n nearest books checked when a new book is added
+
+
+def _neighbor_rows(catalog: CatalogIndex, book_id: int, rows: np.ndarray, scores: np.ndarray) -> List[dict]:
+    return [
+        {"book_id": book_id, "neighbor_id": int(catalog.ids[r]), "score": float(s)}
+        for r, s in zip(rows.tolist(), scores.tolist())
+    ]
+
+
+def build_table(db: Session, catalog: CatalogIndex, top_n: int = SIMILAR_TOP_N,
+                block_rows: int = SIMILAR_BLOCK_ROWS) -> int:
+    """Replaces the whole neighbour table; returns the number of rows written. Commits once at the end."""
+    db.query(models.BookNeighbor).delete()
+    written = 0
+    for start in range(0, catalog.size, block_rows):
+        rows = np.arange(start, min(start + block_rows, catalog.size))
+        scores = catalog.score_block(catalog.vectors(rows))
+        scores[np.arange(rows.size), rows] = -np.inf  # A book is not its own neighbour
+        top = ranking.top_k_indices_2d(scores, top_n)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+
+        mappings = []
+        for i, row in enumerate(rows.tolist()):
+            keep = np.isfinite(top_scores[i])
+            mappings.extend(_neighbor_rows(catalog, int(catalog.ids[row]), top[i][keep], top_scores[i][keep]))
+        db.bulk_insert_mappings(models.BookNeighbor, mappings)
+        written += len(mappings)
+    db.commit()
+    return written
+
+
+def add_book(db: Session, book_id: int, top_n: int = SIMILAR_TOP_N):
+    """
+    Adds the rows of one new (already catalog-indexed) book. Reverse updates only look at
+    its SIMILAR_REVERSE_CANDIDATES * top_n nearest books; build_table() makes the graph exact again.
+    """
+    catalog = catalog_index.get_index(db)
+    if catalog is None or book_id not in catalog.row_of:
+        return
+    row = catalog.row_of[book_id]
+    scores = catalog.scores(catalog.vectors(np.array([row]))[0])
+    scores[row] = -np.inf
+
+    # Its own list
+    top = ranking.top_k(scores, top_n)
+    db.query(models.BookNeighbor).filter(models.BookNeighbor.book_id == book_id).delete()
+    db.bulk_insert_mappings(models.BookNeighbor, _neighbor_rows(catalog, book_id, top, scores[top]))
+
+    # Enter the lists of nearby books whose current worst neighbour it beats
+    candidates = ranking.top_k(scores, top_n * SIMILAR_REVERSE_CANDIDATES)
+    score_of = {int(catalog.ids[r]): float(scores[r]) for r in candidates.tolist()}
+    stats = (
+        db.query(models.BookNeighbor.book_id, func.count(), func.min(models.BookNeighbor.score))
+        .filter(models.BookNeighbor.book_id.in_(list(score_of)))
+        .group_by(models.BookNeighbor.book_id)
+    )
+    current = {other_id: (count, worst) for other_id, count, worst in stats}
+    for other_id, score in score_of.items():
+        count, worst = current.get(other_id, (0, None))
+        if count >= top_n and score <= worst:
+            continue
+        db.merge(models.BookNeighbor(book_id=other_id, neighbor_id=book_id, score=score))
+        if count >= top_n:
+            worst_row = (
+                db.query(models.BookNeighbor)
+                .filter(models.BookNeighbor.book_id == other_id, models.BookNeighbor.neighbor_id != book_id)
+                .order_by(models.BookNeighbor.score.asc())
+                .first()
+            )
+            db.delete(worst_row)
+    db.commit()
@@ -0,0 +1,146 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .. import models
+from .catalog_index import CatalogIndex, DerivedIndex, DerivedIndexSlot
+
+# Inverted index over the aggregated Book.tags counts: (field, value) -> posting list
+# of (catalog row, weight). A book's tag weights are its per-field vote shares,
+# L2-normalized, so the tag score of a candidate is a cosine between tag profiles and
+# only the posting lists of the user's own tags are touched.
+TAG_FIELDS = [
+    "is_fiction",
+    "primary_genres",
+    "subgenres",
+    "main_topics",
+    "structure_features",
+    "narrative_pov",
+    "style_descriptors",
+    "tone_mood",
+    "complexity_level",
+    "character_vs_plot_driven",
+    "emotional_impact",
+    "reading_energy",
+    "target_audience",
+    "world_type",
+    "time_period",
+    "primary_locales",
+    "nonfiction_type",
+    "main_subjects",
+]
+IGNORED_VALUES = {"null", "None", "unknown", "unspecified", ""}
+
+
+def book_terms(tags) -> Dict[Tuple[str, str], float]:
+    """Turns aggregated tag counts ({field: {value: count}}) into unit-norm term weights."""
+    terms = {}
+    if not isinstance(tags, dict):
+        return terms
+    for field in TAG_FIELDS:
+        counts = tags.get(field)
+        if isinstance(counts, (str, int, float)):
+            counts = {counts: 1}  # Un-aggregated (single chunk) tags
+        elif isinstance(counts, list):
+            counts = {value: 1 for value in counts}
+        if not isinstance(counts, dict):
+            continue
+        counts = {
+            str(value): count for value, count in counts.items()
+            if str(value) not in IGNORED_VALUES and isinstance(count, (int, float)) and count > 0
+        }
+        total = float(sum(counts.values()))
+        for value, count in counts.items():
+            terms[(field, value)] = count / total
+    norm = np.sqrt(sum(w * w for w in terms.values()))
+    if norm > 0:
+        terms = {term: w / norm for term, w in terms.items()}
+    return terms
+
+
+class Posting:
+    def __init__(self):
+        self._rows: List[int] = []
+        self._weights: List[float] = []
+        self._arrays = None
+
+    def append(self, row: int, weight: float):
+        self._rows.append(row)
+        self._weights.append(weight)
+        self._arrays = None
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = (np.asarray(self._rows, dtype=np.int64), np.asarray(self._weights, dtype=np.float32))
+        return self._arrays
+
+
+class TagIndex(DerivedIndex):
+    def __init__(self, catalog: CatalogIndex):
+        super().__init__(catalog)
+        self.postings: Dict[Tuple[str, str], Posting] = {}
+        self.terms_by_row: Dict[int, Dict[Tuple[str, str], float]] = {}
+
+    def add(self, book_id: int, tags):
+        row = self.catalog.row_of.get(book_id)
+        if row is None or row in self.terms_by_row:
+            return
+        terms = book_terms(tags)
+        self.terms_by_row[row] = terms
+        for term, weight in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = Posting()
+            posting.append(row, weight)
+
+    def user_terms(self, rows, book_weights: Optional[Sequence[float]] = None) -> Dict[Tuple[str, str], float]:
+        """Unit-norm tag profile of the books at the given catalog rows, each scaled by its profile weight."""
+        profile = {}
+        if book_weights is None:
+            book_weights = [1.0] * len(rows)
+        for row, book_weight in zip(rows, book_weights):
+            for term, weight in self.terms_by_row.get(int(row), {}).items():
+                profile[term] = profile.get(term, 0.0) + book_weight * weight
+        norm = np.sqrt(sum(w * w for w in profile.values()))
+        if norm > 0:
+            profile = {term: w / norm for term, w in profile.items()}
+        return profile
+
+    def scores(self, profile: Dict[Tuple[str, str], float], size: int) -> np.ndarray:
+        """Tag cosine of every catalog row (first `size` rows) against a user tag profile."""
+        scores = np.zeros(size, dtype=np.float32)
+        for term, weight in profile.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, weights = posting.arrays()
+            keep = rows < size
+            np.add.at(scores, rows[keep], weight * weights[keep])
+        return scores
+
+    def matched_terms(self, profile, row: int, limit: int = 3) -> List[str]:
+        """The user's tags that contribute most to one book's tag score."""
+        terms = self.terms_by_row.get(int(row), {})
+        shared = [(profile[t] * w, t) for t, w in terms.items() if profile.get(t, 0.0) > 0]
+        shared.sort(reverse=True)
+        return [f"{field}:{value}" for _, (field, value) in shared[:limit]]
+
+
+def build_index(db: Session, catalog: CatalogIndex) -> TagIndex:
+    index = TagIndex(catalog)
+    index.sync(db, catalog)
+    return index
+
+
+_tag_index = DerivedIndexSlot(build_index)
+
+
+def get_index(db: Session, catalog: Optional[CatalogIndex]) -> Optional[TagIndex]:
+    """Returns the process-wide tag index for the catalog (see DerivedIndexSlot)."""
+    return _tag_index.get(db, catalog)
+
+
+def add_book(db: Session, book: models.Book):
+    """Adds a newly created (and already catalog-indexed) book, and any other new catalog rows."""
+    _tag_index.follow(db)
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# 청크 태그/임베딩 결과를 저장하는 로컬 SQLite 캐시 (content-addressed).
+# 키는 sha256(종류, 모델, 프롬프트 버전, 청크 텍스트)라서 파일 이름이나 경로와 무관하게
+# 같은 텍스트를 같은 설정으로 다시 처리하면 네트워크 호출 없이 결과를 돌려줌.
+# 웹 업로드(app/services/analysis.py)와 배치 파이프라인(auto_analysis/pipeline.py)이
+# 같은 파일을 쓰도록 기본 경로는 사용자 캐시 디렉터리. 전체 크기가 한도를 넘으면
+# 가장 오래 쓰이지 않은 항목부터 지움 (LRU).
+load_dotenv()
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE", "1") == "1"
+RESULT_CACHE_PATH = os.getenv(
+    "RESULT_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "book_analysis", "result_cache.sqlite3"),
+)
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "512"))
+EVICT_TARGET_RATIO = 0.9  # 한도를 넘으면 한도의 90%까지 줄임
+
+_conn = None
+_lock = threading.Lock()
+_size = None
+
+
+def make_key(kind: str, model: str, prompt_version: str, text: str) -> str:
+    h = hashlib.sha256()
+    for part in (kind, model, prompt_version, text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _connect():
+    global _conn, _size
+    if _conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(RESULT_CACHE_PATH)), exist_ok=True)
+        conn = sqlite3.connect(RESULT_CACHE_PATH, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_results_last_used ON results (last_used)")
+        conn.commit()
+        _size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        _conn = conn
+    return _conn
+
+
+def get_many(keys):
+    """키 리스트에 대해 {key: 값}을 반환 (없는 키는 빠짐). 찾은 항목은 최근 사용으로 갱신."""
+    keys = list(dict.fromkeys(keys))
+    if not RESULT_CACHE_ENABLED or not keys:
+        return {}
+    try:
+        with _lock:
+            conn = _connect()
+            found = {}
+            for start in range(0, len(keys), 500):
+                block = keys[start:start + 500]
+                placeholders = ",".join("?" * len(block))
+                rows = conn.execute(f"SELECT key, value FROM results WHERE key IN ({placeholders})", block)
+                found.update((key, json.loads(value)) for key, value in rows)
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE results SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                conn.commit()
+            return found
+    except (sqlite3.Error, ValueError) as e:
+        print(f"[WARNING] Result cache read failed: {e}")
+        return {}
+
+
+def get(key):
+    return get_many([key]).get(key)
+
+
+def put_many(kind: str, items):
+    """(key, 값) 쌍들을 저장. 값은 JSON으로 직렬화 가능해야 함."""
+    global _size
+    items = [(key, json.dumps(value, ensure_ascii=False)) for key, value in items if value is not None]
+    if not RESULT_CACHE_ENABLED or not items:
+        return
+    try:
+        with _lock:
+            conn = _connect()
+            now = time.time()
+            placeholders = ",".join("?" * len(items))
+            replaced = conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM results WHERE key IN ({placeholders})", [k for k, _ in items]
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT OR REPLACE INTO results (key, kind, value, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(key, kind, value, len(value.encode("utf-8")), now) for key, value in items],
+            )
+            _size += sum(len(value.encode("utf-8")) for _, value in items) - replaced
+            _evict(conn)
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"[WARNING] Result cache write failed: {e}")
+
+
+def put(kind: str, key: str, value):
+    put_many(kind, [(key, value)])
+
+
+def _evict(conn):
+    """전체 크기가 RESULT_CACHE_MAX_MB를 넘으면 오래 쓰이지 않은 항목부터 삭제."""
+    global _size
+    limit = RESULT_CACHE_MAX_MB * 1024 * 1024
+    if _size <= limit:
+        return
+    # 다른 프로세스가 쓴 양까지 반영해서 다시 계산
+    _size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+    target = limit * EVICT_TARGET_RATIO
+    while _size > target:
+        rows = conn.execute("SELECT key, size FROM results ORDER BY last_used LIMIT 500").fetchall()
+        if not rows:
+            break
+        removed = []
+        for key, size in rows:
+            removed.append((key,))
+            _size -= size
+            if _size <= target:
+                break
+        conn.executemany("DELETE FROM results WHERE key = ?", removed)
@@ -1,10 +1,18 @@
 import os
 import json
-import requests
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+from . import http_client, result_cache
+
 load_dotenv()
 GMS_KEY = os.getenv("GMS_KEY")
+# 동시에 보내는 태깅 요청 수 상한 (게이트웨이 rate limit에 맞춰 조정)
+TAG_CONCURRENCY = int(os.getenv("TAG_CONCURRENCY", "5"))
+# 분당 토큰 한도 계산 시 응답(JSON 태그) 몫으로 더하는 추정 토큰 수
+TAG_OUTPUT_TOKENS_ESTIMATE = 1500
+TAG_MODEL = "gpt-5-nano"
 
 ANALYSIS_SYSTEM_PROMPT = """
 당신은 소설/논픽션 텍스트를 분석해 메타데이터를 추출하는 태깅 엔진입니다.
@@ -64,30 +72,34 @@ ANALYSIS_SYSTEM_PROMPT = """
 - content_warnings 필드는 항상 위의 키들을 모두 포함해야 합니다.
 """
 
+ANALYSIS_USER_PROMPT = """
+다음은 책의 일부(청크)입니다. 이 텍스트만 보고 위 스키마에 맞는 JSON을 생성하세요.
+
+[텍스트 시작]
+{chunk}
+[텍스트 끝]
+"""
+
+# 프롬프트를 고치면 버전이 바뀌어 이전 결과 캐시를 자동으로 무시함
+TAG_PROMPT_VERSION = hashlib.sha256((ANALYSIS_SYSTEM_PROMPT + ANALYSIS_USER_PROMPT).encode("utf-8")).hexdigest()[:16]
+
 def tag_chunk_with_gpt(chunk: str) -> dict | None:
     """
     책 본문 청크(text)를 입력으로 받아, 분석 스키마에 맞는 태그 JSON(dict)을 반환.
-    오류가 나면 None 반환.
+    같은 청크/모델/프롬프트의 결과가 캐시에 있으면 API를 호출하지 않음.
+    오류가 나면 None 반환 (실패는 캐시하지 않음).
     """
-    gms_key = GMS_KEY
-
     gpt_endpoint = "https://gms.ssafy.io/gmsapi/api.openai.com/v1/chat/completions"
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {gms_key}",
-    }
 
-    user_prompt = f"""
-다음은 책의 일부(청크)입니다. 이 텍스트만 보고 위 스키마에 맞는 JSON을 생성하세요.
+    cache_key = result_cache.make_key("tag", TAG_MODEL, TAG_PROMPT_VERSION, chunk)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-[텍스트 시작]
-{chunk}
-[텍스트 끝]
-"""
+    user_prompt = ANALYSIS_USER_PROMPT.format(chunk=chunk)
 
     body = {
-        "model": "gpt-5-nano",
+        "model": TAG_MODEL,
         "messages": [
             {"role": "developer", "content": ANALYSIS_SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt}
@@ -95,7 +107,8 @@ def tag_chunk_with_gpt(chunk: str) -> dict | None:
     }
 
     try:
-        res = requests.post(gpt_endpoint, headers=headers, json=body)
+        tokens = http_client.estimate_tokens(ANALYSIS_SYSTEM_PROMPT + user_prompt) + TAG_OUTPUT_TOKENS_ESTIMATE
+        res = http_client.post(gpt_endpoint, json=body, tokens=tokens)
         
         if res.status_code != 200:
             print("API Error:", res.status_code, res.text)
@@ -104,22 +117,51 @@ def tag_chunk_with_gpt(chunk: str) -> dict | None:
         content = res.json()["choices"][0]["message"]["content"].strip()
         
         # LLM이 JSON만 반환했다고 가정하고 파싱
-        try:
-            parsed = json.loads(content)
-            return parsed
-        except json.JSONDecodeError:
-            # 혹시 모를 앞뒤 텍스트/코드블록 제거용 간단한 fallback
-            try:
-                if "{" in content and "}" in content:
-                    json_str = content[content.index("{"): content.rindex("}") + 1]
-                    return json.loads(json_str)
-            except Exception:
-                pass
-
+        parsed = _parse_json(content)
+        if parsed is None:
             print("JSON 파싱 실패. 원본 응답:")
             print(content)
             return None
+        result_cache.put("tag", cache_key, parsed)
+        return parsed
             
     except Exception as e:
         print(f"Request failed: {e}")
         return None
+
+def _parse_json(content: str):
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        # 혹시 모를 앞뒤 텍스트/코드블록 제거용 간단한 fallback
+        try:
+            if "{" in content and "}" in content:
+                json_str = content[content.index("{"): content.rindex("}") + 1]
+                return json.loads(json_str)
+        except Exception:
+            pass
+    return None
+
+def tag_chunks(chunks, max_workers=None, on_done=None) -> list:
+    """
+    여러 청크를 동시에 태깅하는 함수. 각 호출은 독립적인 네트워크 I/O라
+    전체 소요 시간이 호출 시간의 합이 아니라 가장 느린 호출 정도로 줄어듦.
+    결과는 입력 순서대로 반환하며, 실패한 청크 자리는 None.
+    on_done(완료 개수, 전체 개수)가 주어지면 청크 하나가 끝날 때마다 호출.
+    """
+    chunks = list(chunks)
+    results = [None] * len(chunks)
+    if not chunks:
+        return results
+
+    workers = max(1, min(max_workers or TAG_CONCURRENCY, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tagger") as executor:
+        futures = {executor.submit(tag_chunk_with_gpt, chunk): i for i, chunk in enumerate(chunks)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Tagging failed: {e}")
+            if on_done:
+                on_done(done, len(chunks))
+    return results
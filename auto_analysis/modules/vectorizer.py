@@ -1,35 +1,52 @@
 import os
-import requests
 import numpy as np
 from dotenv import load_dotenv
 
+from . import http_client, result_cache
+
 # 환경 변수 로드 (모듈 임포트 시 로드)
 load_dotenv()
 GMS_KEY = os.getenv("GMS_KEY")
 
 EMBED_ENDPOINT = "https://gms.ssafy.io/gmsapi/api.openai.com/v1/embeddings"
 EMBED_MODEL = "text-embedding-3-large"
+# 축소 차원 모드: 설정 시 API에 dimensions 파라미터를 보내 256/512/1024차원 등으로 받음 (미설정 시 3072)
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS")) if os.getenv("EMBED_DIMENSIONS") else None
 
-def get_embedding(text: str):
-    """
-    텍스트를 임베딩 벡터로 변환하는 함수.
-    """
-    if not GMS_KEY:
-        print("[ERROR] GMS_KEY not found in environment variables.")
-        return None
+# 배치 요청 한도: 요청당 입력 개수 / 총 토큰 수 (text-embedding-3 API 제한보다 조금 여유 있게)
+EMBED_MAX_INPUTS_PER_REQUEST = int(os.getenv("EMBED_MAX_INPUTS_PER_REQUEST", "2048"))
+EMBED_MAX_TOKENS_PER_REQUEST = int(os.getenv("EMBED_MAX_TOKENS_PER_REQUEST", "250000"))
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {GMS_KEY}"
-    }
+def estimate_tokens(text: str) -> int:
+    return http_client.estimate_tokens(text)
+
+def _pack_batches(texts):
+    """입력 순서를 유지하면서 요청당 개수/토큰 한도 안으로 인덱스를 묶는 함수."""
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= EMBED_MAX_INPUTS_PER_REQUEST or current_tokens + tokens > EMBED_MAX_TOKENS_PER_REQUEST):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
 
+def _request_embeddings(inputs):
+    """
+    입력 리스트를 한 번의 API 호출로 임베딩. 성공 시 입력 순서대로 정렬된 벡터 리스트, 실패 시 None.
+    """
     body = {
         "model": EMBED_MODEL,
-        "input": text
+        "input": inputs
     }
+    if EMBED_DIMENSIONS:
+        body["dimensions"] = EMBED_DIMENSIONS
 
     try:
-        res = requests.post(EMBED_ENDPOINT, headers=headers, json=body)
+        res = http_client.post(EMBED_ENDPOINT, json=body, tokens=sum(estimate_tokens(t) for t in inputs))
         
         if res.status_code != 200:
             print("Embedding API Error:", res.status_code)
@@ -37,11 +54,83 @@ def get_embedding(text: str):
                 f.write(res.text)
             return None
 
-        return res.json()["data"][0]["embedding"]
+        # 응답의 index 필드 기준으로 입력 순서 복원
+        data = sorted(res.json()["data"], key=lambda item: item["index"])
+        if len(data) != len(inputs):
+            print(f"[ERROR] Embedding API returned {len(data)} vectors for {len(inputs)} inputs.")
+            return None
+        embeddings = []
+        for item in data:
+            embedding = item["embedding"]
+            if EMBED_DIMENSIONS and len(embedding) > EMBED_DIMENSIONS:
+                # 게이트웨이가 dimensions를 무시한 경우 클라이언트에서 잘라서 재정규화
+                embedding = truncate_embedding(embedding, EMBED_DIMENSIONS)
+            embeddings.append(embedding)
+        return embeddings
     except Exception as e:
         print(f"[ERROR] Embedding request failed: {e}")
         return None
 
+def get_embeddings(texts):
+    """
+    여러 텍스트를 배치로 임베딩하는 함수. 요청당 입력 개수/토큰 한도 안에서 최대한 묶어
+    보내므로 책 한 권(샘플 5개)은 보통 한 번의 왕복으로 끝남.
+    결과는 입력 순서대로 반환하며, 실패한 입력 자리는 None.
+    배치 요청이 실패하면 그 배치만 입력별로 다시 요청해서 실패를 해당 입력으로 한정.
+    같은 텍스트/모델/차원의 결과가 캐시에 있으면 그 입력은 요청하지 않음.
+    """
+    texts = list(texts)
+    results = [None] * len(texts)
+    if not texts:
+        return results
+
+    # 캐시에 있는 텍스트는 건너뛰고 나머지만 요청
+    model = f"{EMBED_MODEL}:{EMBED_DIMENSIONS or 'full'}"
+    keys = [result_cache.make_key("embedding", model, "", text) for text in texts]
+    cached = result_cache.get_many(keys)
+    missing = []
+    for i, key in enumerate(keys):
+        if key in cached:
+            results[i] = cached[key]
+        else:
+            missing.append(i)
+    if not missing:
+        return results
+    if not GMS_KEY:
+        print("[ERROR] GMS_KEY not found in environment variables.")
+        return results
+
+    for batch in _pack_batches([texts[i] for i in missing]):
+        batch = [missing[j] for j in batch]
+        embeddings = _request_embeddings([texts[i] for i in batch])
+        if embeddings is None and len(batch) > 1:
+            embeddings = [(_request_embeddings([texts[i]]) or [None])[0] for i in batch]
+        if embeddings is None:
+            continue
+        for i, embedding in zip(batch, embeddings):
+            results[i] = embedding
+        result_cache.put_many("embedding", [(keys[i], results[i]) for i in batch])
+    return results
+
+def get_embedding(text: str):
+    """
+    텍스트를 임베딩 벡터로 변환하는 함수.
+    """
+    return get_embeddings([text])[0]
+
+def truncate_embedding(vector, dimensions):
+    """
+    이미 받은 임베딩을 앞쪽 dimensions 차원만 남기고 다시 L2 정규화하는 함수.
+    text-embedding-3 계열은 앞쪽 차원에 정보가 몰려 있어 API의 dimensions 파라미터와 같은 효과.
+    """
+    if vector is None:
+        return None
+    v = np.asarray(vector, dtype=np.float32)[:dimensions]
+    norm = np.linalg.norm(v)
+    if norm == 0:
+        return v.tolist()
+    return (v / norm).tolist()
+
 def get_average_embedding(vectors):
     """
     벡터 리스트의 평균 벡터를 계산하는 함수.
@@ -2,7 +2,7 @@ import os
 import sys
 import random
 import json
-import time
+import hashlib
 from dotenv import load_dotenv
 
 # 모듈 경로 추가
@@ -73,6 +73,8 @@ def main():
         try:
             with open(txt_path, 'r', encoding='utf-8') as f:
                 text_content = f.read()
+            # 샘플링 시드를 본문 해시로 고정: 같은 책을 다시 돌리면 같은 청크가 뽑혀 결과 캐시를 그대로 씀
+            content_seed = hashlib.sha256(text_content.encode("utf-8")).hexdigest()
             
             chunks = splitter.split_into_chunks(text_content) # 기본 설정 사용
             
@@ -104,6 +106,7 @@ def main():
         else:
             # 전체를 5개 구간으로 나누어 각 구간에서 하나씩 선택
             segment_size = len(chunks) / target_sample_count
+            rng = random.Random(f"{content_seed}:tag")
             for i in range(target_sample_count):
                 start_idx = int(i * segment_size)
                 end_idx = int((i + 1) * segment_size)
@@ -112,32 +115,33 @@ def main():
                     end_idx = len(chunks)
                 
                 if start_idx < end_idx:
-                    selected_idx = random.randint(start_idx, end_idx - 1)
+                    selected_idx = rng.randint(start_idx, end_idx - 1)
                     selected_indices.append(selected_idx)
         
         print(f"    -> Selected {len(selected_indices)} chunks for tagging (out of {len(chunks)})")
         
+        # 이미 태깅된 청크는 건너뛰고, 나머지는 동시에 태깅 (결과 순서는 입력 순서 유지)
+        pending = []
         for i, idx in enumerate(selected_indices):
-            chunk_text = chunks[idx]
             tag_filename = f"{file_name_no_ext}_tag_{i+1:02d}.json"
             tag_path = os.path.join(book_tags_dir, tag_filename)
             
             if os.path.exists(tag_path):
                  print(f"    -> Tagging chunk {idx+1}/{len(chunks)} as {tag_filename}... (Skipping, file exists)")
                  continue
+            pending.append((idx, tag_filename, tag_path))
 
-            print(f"    -> Tagging chunk {idx+1}/{len(chunks)} as {tag_filename}...", end="", flush=True)
-            
-            tags = tagger.tag_chunk_with_gpt(chunk_text)
-            
+        if pending:
+            print(f"    -> Tagging {len(pending)} chunks concurrently (max {tagger.TAG_CONCURRENCY})...", flush=True)
+        results = tagger.tag_chunks([chunks[idx] for idx, _, _ in pending])
+
+        for (idx, tag_filename, tag_path), tags in zip(pending, results):
             if tags:
                 with open(tag_path, 'w', encoding='utf-8') as f:
                     json.dump(tags, f, ensure_ascii=False, indent=2)
-                print(" Done.")
+                print(f"    -> Tagged chunk {idx+1}/{len(chunks)} as {tag_filename}. Done.")
             else:
-                print(" Failed.")
-            
-            time.sleep(0.5)
+                print(f"    -> Tagged chunk {idx+1}/{len(chunks)} as {tag_filename}. Failed.")
 
         # --- Step 4: Tag Aggregation ---
         print(f"  [4/5] Aggregating Tags...")
@@ -168,13 +172,14 @@ def main():
                 vec_selected_indices = list(range(len(vec_chunks)))
             else:
                 segment_size = len(vec_chunks) / target_sample_count
+                rng = random.Random(f"{content_seed}:vec")
                 for i in range(target_sample_count):
                     start_idx = int(i * segment_size)
                     end_idx = int((i + 1) * segment_size)
                     if i == target_sample_count - 1:
                         end_idx = len(vec_chunks)
                     if start_idx < end_idx:
-                        selected_idx = random.randint(start_idx, end_idx - 1)
+                        selected_idx = rng.randint(start_idx, end_idx - 1)
                         vec_selected_indices.append(selected_idx)
             
             print(f"    -> Selected {len(vec_selected_indices)} chunks for vectorization")
@@ -184,31 +189,30 @@ def main():
             book_vecs_dir = os.path.join(vecs_output_dir, f"{file_name_no_ext}_vecs")
             os.makedirs(book_vecs_dir, exist_ok=True)
 
+            # 이미 존재하면 로드 (API 절약), 나머지는 한 번의 배치 요청으로 임베딩
+            vectors = [None] * len(vec_selected_indices)
+            pending = []
             for i, idx in enumerate(vec_selected_indices):
-                chunk_text = vec_chunks[idx]
                 vec_filename = f"{file_name_no_ext}_vec_{i+1:02d}.json"
                 vec_path = os.path.join(book_vecs_dir, vec_filename)
-
-                print(f"    -> Vectorizing chunk {idx+1}/{len(vec_chunks)}...", end="", flush=True)
-                
-                # 이미 존재하면 로드 (API 절약)
                 if os.path.exists(vec_path):
-                    print(" (Loading existing)...", end="")
+                    print(f"    -> Vectorizing chunk {idx+1}/{len(vec_chunks)}... (Loading existing)")
                     with open(vec_path, 'r', encoding='utf-8') as f:
-                        vector = json.load(f)
+                        vectors[i] = json.load(f)
                 else:
-                    vector = vectorizer.get_embedding(chunk_text)
+                    pending.append((i, vec_path))
+
+            if pending:
+                print(f"    -> Vectorizing {len(pending)} chunks in one batch...", end="", flush=True)
+                embedded = vectorizer.get_embeddings([vec_chunks[vec_selected_indices[i]] for i, _ in pending])
+                for (i, vec_path), vector in zip(pending, embedded):
                     if vector:
                         with open(vec_path, 'w', encoding='utf-8') as f:
                             json.dump(vector, f)
-                
-                if vector:
-                    generated_vectors.append(vector)
-                    print(" Done.")
-                else:
-                    print(" Failed.")
-                
-                time.sleep(0.2) # Rate limit
+                    vectors[i] = vector
+                print(f" Done ({sum(1 for v in embedded if v)}/{len(pending)}).")
+
+            generated_vectors = [vector for vector in vectors if vector]
 
             # 4) 평균 벡터 계산 및 저장
             if generated_vectors:
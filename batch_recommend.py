@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add the current directory to sys.path to make sure we can import app modules
+sys.path.append(os.getcwd())
+
+from app import models, migrations
+from app.database import SessionLocal, engine
+from app.services import batch_recommend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write top-k recommendations for many users as JSON Lines.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--users", help="comma separated user ids (e.g. 1,2,3)")
+    group.add_argument("--all", action="store_true", help="every user in the DB")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", "-o", help="output .jsonl path (default: stdout)")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+
+    user_ids = None if args.all else [int(u) for u in args.users.split(",") if u.strip()]
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    start = time.time()
+    count = 0
+    db = SessionLocal()
+    try:
+        for result in batch_recommend.iter_batch_recommendations(db, user_ids, top_k=args.top_k):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            count += 1
+    finally:
+        db.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"✅  Wrote recommendations for {count} users in {time.time() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
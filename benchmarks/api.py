@@ -0,0 +1,243 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Add the current directory to sys.path to make sure we can import app modules
+sys.path.append(os.getcwd())
+
+from app.services.modules import tagger  # Only the prompt schema; does not import app.database
+
+# Benchmarks the HTTP API end to end (routing, DB, scoring, serialization) against a
+# throwaway SQLite DB filled with synthetic books/users. app.database reads
+# BOOKS_DB_PATH at import time, so the app is imported inside main() after it is set.
+
+def schema_enums(prompt: str) -> dict:
+    """
+    Enumerated values of the tagger's JSON schema (the "a | b | null" fields, and the
+    content_warnings sub-fields), without null/unknown.
+    """
+    schema = json.loads(prompt[prompt.index("{"):prompt.rindex("}") + 1])
+
+    def values(spec):
+        return [v for v in (part.strip() for part in spec.split("|")) if v not in ("null", "unknown")]
+
+    enums = {}
+    for field, spec in schema.items():
+        if isinstance(spec, str):
+            enums[field] = values(spec)
+        elif isinstance(spec, dict):
+            enums[field] = {sub: values(sub_spec) for sub, sub_spec in spec.items()}
+    return enums
+
+
+# Free-text list fields only have examples in the schema; these follow them
+TAG_LISTS = {
+    "primary_genres": ["판타지", "로맨스", "미스터리", "SF", "에세이", "자기계발", "인문", "경제경영"],
+    "subgenres": ["로맨스 판타지", "하드 SF", "심리 스릴러", "성장소설", "가족 드라마"],
+    "main_topics": ["성장", "우정", "복수", "전쟁", "직장생활", "창업", "연애", "가족", "우울", "삶의 의미"],
+    "tone_mood": ["어두운", "따뜻한", "희망적인", "우울한", "잔잔한", "긴장감 있는", "로맨틱한"],
+    "emotional_impact": ["감동", "카타르시스", "슬픔", "몰입감", "위로", "여운", "공포"],
+}
+TAG_ENUMS = schema_enums(tagger.ANALYSIS_SYSTEM_PROMPT)
+# Most books carry no or mild warnings and a general age rating
+LEVEL_WEIGHTS = [0.55, 0.25, 0.13, 0.07]
+AGE_WEIGHTS = [0.4, 0.3, 0.2, 0.1]
+STATUSES = ["finished", "finished", "finished", "reading", "dropped"]
+
+
+def _votes(rng, values, weights=None) -> dict:
+    picks = rng.choice(len(values), size=rng.integers(1, 3), replace=False, p=weights)
+    return {values[i]: int(rng.integers(1, 6)) for i in picks}
+
+
+def synthetic_tags(rng) -> dict:
+    """Aggregated (field -> {value: chunk votes}) tags, shaped like aggregator output."""
+    tags = {field: _votes(rng, values) for field, values in TAG_LISTS.items()}
+    for field, values in TAG_ENUMS.items():
+        if field == "content_warnings":
+            tags[field] = {sub: _votes(rng, levels, LEVEL_WEIGHTS) for sub, levels in values.items()}
+        elif field == "age_rating_estimate":
+            tags[field] = _votes(rng, values, AGE_WEIGHTS)
+        else:
+            tags[field] = _votes(rng, values)
+    return tags
+
+
+def seed(n_books: int, n_users: int, n_user_books: int, dim: int, seed_value: int = 0):
+    """Fills the (empty) DB through the app.models schema with bulk inserts."""
+    from app import models
+    from app.database import SessionLocal
+
+    rng = np.random.default_rng(seed_value)
+    db = SessionLocal()
+    try:
+        block = 1000
+        for start in range(0, n_books, block):
+            size = min(block, n_books - start)
+            vectors = rng.standard_normal((size, dim)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            db.bulk_insert_mappings(models.Book, [
+                {"title": f"Book {start + i}", "author": f"Author {(start + i) % 997}",
+                 "embedding": vectors[i], "tags": synthetic_tags(rng)}
+                for i in range(size)
+            ])
+            db.commit()
+        db.bulk_insert_mappings(models.User, [
+            {"name": f"User {i}", "email": f"user{i}@example.com"} for i in range(n_users)
+        ])
+        db.commit()
+
+        pairs = set()
+        while len(pairs) < min(n_user_books, n_users * n_books):
+            pairs.add((int(rng.integers(1, n_users + 1)), int(rng.integers(1, n_books + 1))))
+        pairs = sorted(pairs)
+        for start in range(0, len(pairs), 10000):
+            db.bulk_insert_mappings(models.UserBook, [
+                {"user_id": u, "book_id": b, "status": STATUSES[int(rng.integers(len(STATUSES)))],
+                 "rating": int(rng.integers(1, 6)) if rng.random() < 0.7 else None}
+                for u, b in pairs[start:start + 10000]
+            ])
+            db.commit()
+    finally:
+        db.close()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(client_factory, name: str, paths, concurrency: int, warmup: int) -> dict:
+    client = client_factory()
+    for path in paths[:warmup]:
+        client.get(path)
+    paths = paths[warmup:]
+
+    def timed(path, c):
+        start = time.perf_counter()
+        response = c.get(path)
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} -> {response.status_code}: {response.text[:200]}")
+        return elapsed
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        latencies = [timed(p, client) for p in paths]
+    else:
+        clients = [client_factory() for _ in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(lambda ip: timed(ip[1], clients[ip[0] % concurrency]), enumerate(paths)))
+    wall = time.perf_counter() - start
+
+    lat = np.asarray(latencies)
+    return {
+        "scenario": name,
+        "requests": len(paths),
+        "concurrency": concurrency,
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        "mean_ms": round(float(lat.mean()), 3),
+        "throughput_rps": round(len(paths) / wall, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run(args, log) -> dict:
+    from app import models, migrations
+    from app.database import engine
+    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+
+    start = time.time()
+    seed(args.books, args.users, args.user_books, args.dim)
+    seed_s = time.time() - start
+    log(f"🛠️  Seeded {args.books} books x {args.dim} dims, {args.users} users, {args.user_books} shelf entries ({seed_s:.1f}s)")
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+    factory = lambda: TestClient(app)
+
+    rng = np.random.default_rng(1)
+    user_ids = rng.integers(1, args.users + 1, args.requests + args.warmup).tolist()
+    skips = rng.integers(0, max(1, args.books - 20), args.requests + args.warmup).tolist()
+
+    start = time.time()
+    factory().get(f"/users/{user_ids[0]}/recommendations?strategy=vector")  # Builds the catalog index
+    index_s = time.time() - start
+
+    scenarios = []
+    for strategy in args.strategies.split(","):
+        paths = [f"/users/{u}/recommendations?top_k=10&strategy={strategy}" for u in user_ids]
+        scenarios.append(run_scenario(factory, f"recommendations_{strategy}", paths, args.concurrency, args.warmup))
+    scenarios.append(run_scenario(factory, "books_list", [f"/books/?skip={s}&limit=20" for s in skips], args.concurrency, args.warmup))
+    scenarios.append(run_scenario(factory, "books_search", [f"/books/?q=Author%20{s % 997}" for s in skips], args.concurrency, args.warmup))
+    scenarios.append(run_scenario(factory, "user_books", [f"/users/{u}/books" for u in user_ids], args.concurrency, args.warmup))
+
+    return {
+        "config": {"books": args.books, "users": args.users, "user_books": args.user_books,
+                   "dim": args.dim, "requests": args.requests, "concurrency": args.concurrency,
+                   "cache": args.cache},
+        "seed_s": round(seed_s, 2),
+        "first_request_s": round(index_s, 2),
+        "scenarios": scenarios,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency/throughput of the recommendation and listing APIs on a synthetic catalog.")
+    parser.add_argument("--books", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--user-books", type=int, default=10000, help="total shelf entries across all users")
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--strategies", default="vector,hybrid")
+    parser.add_argument("--cache", action="store_true", help="keep the recommendation cache on (off by default to time scoring)")
+    parser.add_argument("--db-dir", help="where to create the throwaway DB (default: a temp dir, removed afterwards)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    args = parser.parse_args()
+
+    work_dir = args.db_dir or tempfile.mkdtemp(prefix="books-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    os.environ["BOOKS_DB_PATH"] = os.path.join(work_dir, "bench.db")
+    if os.path.exists(os.environ["BOOKS_DB_PATH"]):
+        raise SystemExit(f"{os.environ['BOOKS_DB_PATH']} already exists; the benchmark needs an empty DB.")
+    if not args.cache:
+        os.environ["REC_CACHE_MAX_ENTRIES"] = "0"
+    log = (lambda *a: None) if args.json else print
+    # Keep stdout clean for --json: the app's own progress prints go to stderr
+    quiet = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+
+    try:
+        with quiet:
+            result = run(args, log)
+    finally:
+        if not args.db_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    log(f"⏱️  First recommendation (index build): {result['first_request_s']:.2f}s")
+    log(f"    {'scenario':<24} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'RSS MB':>8}")
+    for s in result["scenarios"]:
+        log(f"    {s['scenario']:<24} {s['p50_ms']:8.2f} {s['p95_ms']:8.2f} {s['p99_ms']:8.2f} "
+            f"{s['throughput_rps']:8.1f} {s['peak_rss_mb']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
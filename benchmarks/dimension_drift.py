@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+# Add the current directory to sys.path to make sure we can import app modules
+sys.path.append(os.getcwd())
+
+from app.services.catalog_index import normalize
+from app.services.ranking import top_k_indices
+
+
+def load_vectors(input_dirs):
+    """Reads every JSON file holding a flat list of floats (e.g. toVec/Vectors_cal/*_output.json)."""
+    labels, vectors = [], []
+    for input_dir in input_dirs:
+        for filename in sorted(os.listdir(input_dir)):
+            if not filename.endswith(".json"):
+                continue
+            with open(os.path.join(input_dir, filename), "r", encoding="utf-8") as f:
+                vector = json.load(f)
+            if isinstance(vector, list) and vector and isinstance(vector[0], (int, float)):
+                labels.append(os.path.join(os.path.basename(input_dir), os.path.splitext(filename)[0]))
+                vectors.append(vector)
+    lengths = {len(v) for v in vectors}
+    if len(lengths) > 1:
+        raise SystemExit(f"Vectors have different dimensions: {sorted(lengths)}")
+    return labels, np.asarray(vectors, dtype=np.float32)
+
+
+def _ranks(x: np.ndarray) -> np.ndarray:
+    return np.argsort(np.argsort(x, axis=1), axis=1).astype(np.float64)
+
+
+def drift(matrix: np.ndarray, dim: int, k: int) -> dict:
+    """Compares the truncated+renormalized similarity matrix with the full one."""
+    full = np.stack([normalize(v) for v in matrix])
+    reduced = np.stack([normalize(v[:dim]) for v in matrix])
+    sim_full, sim_reduced = full @ full.T, reduced @ reduced.T
+    n = matrix.shape[0]
+    off_diag = ~np.eye(n, dtype=bool)
+
+    # Per-book ranking of all other books: Spearman correlation and top-k overlap
+    others_full = sim_full[off_diag].reshape(n, n - 1)
+    others_reduced = sim_reduced[off_diag].reshape(n, n - 1)
+    rf, rr = _ranks(others_full), _ranks(others_reduced)
+    rf -= rf.mean(axis=1, keepdims=True)
+    rr -= rr.mean(axis=1, keepdims=True)
+    denom = np.sqrt((rf * rf).sum(axis=1) * (rr * rr).sum(axis=1))
+    spearman = np.where(denom > 0, (rf * rr).sum(axis=1) / np.where(denom > 0, denom, 1), 1.0)
+    k = min(k, n - 1)
+    overlap = np.mean([
+        len(set(top_k_indices(others_full[i], k).tolist()) & set(top_k_indices(others_reduced[i], k).tolist())) / k
+        for i in range(n)
+    ]) if k > 0 else 1.0
+
+    return {
+        "dim": dim,
+        "bytes_per_vector": dim * 4,
+        "mean_abs_cosine_error": float(np.abs(others_full - others_reduced).mean()),
+        "max_abs_cosine_error": float(np.abs(others_full - others_reduced).max()),
+        "spearman": float(spearman.mean()),
+        f"top{k}_overlap": float(overlap),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ranking drift of dimension-truncated embeddings vs full vectors.")
+    parser.add_argument("--input", action="append", help="directory of vector JSON files (repeatable)")
+    parser.add_argument("--dims", default="256,512,1024,1536")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    args = parser.parse_args()
+
+    labels, matrix = load_vectors(args.input or ["./toVec/Vectors_cal"])
+    if matrix.shape[0] < 2:
+        raise SystemExit("Not enough vectors to compare (need at least 2).")
+    dims = [d for d in (int(x) for x in args.dims.split(",")) if d <= matrix.shape[1]]
+    results = [drift(matrix, d, args.k) for d in dims]
+
+    if args.json:
+        print(json.dumps({"vectors": len(labels), "full_dim": matrix.shape[1], "results": results}, indent=2))
+        return
+    print(f"📏  {len(labels)} vectors, full dimension {matrix.shape[1]}")
+    for r in results:
+        overlap_key = next(key for key in r if key.endswith("_overlap"))
+        print(f"    dim={r['dim']:<5d} |Δcos| mean={r['mean_abs_cosine_error']:.4f} max={r['max_abs_cosine_error']:.4f}"
+              f"  spearman={r['spearman']:.3f}  {overlap_key}={r[overlap_key]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
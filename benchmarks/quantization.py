@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the current directory to sys.path to make sure we can import app modules
+sys.path.append(os.getcwd())
+
+from app.services import quantization
+from app.services.catalog_index import CatalogIndex, normalize
+from app.services.ranking import top_k_indices
+
+
+def synthetic_catalog(n: int, dim: int, n_topics: int = 64, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors: books of one 'topic' share a direction plus noise."""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    matrix = topics[rng.integers(0, n_topics, n)] + 0.8 * rng.standard_normal((n, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def db_catalog() -> np.ndarray:
+    from app.database import SessionLocal
+    from app.services import catalog_index
+    db = SessionLocal()
+    try:
+        index = catalog_index.build_index(db)
+    finally:
+        db.close()
+    if index is None:
+        raise SystemExit("No book embeddings in the DB.")
+    return index.vectors().copy()
+
+
+def run(matrix: np.ndarray, methods, k: int, rerank: int, n_queries: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    n, dim = matrix.shape
+    # Queries: mean of a few random books, like a user profile
+    picks = rng.integers(0, n, (n_queries, 5))
+    queries = np.stack([normalize(matrix[p].mean(axis=0)) for p in picks])
+    start = time.time()
+    exact = [set(top_k_indices(matrix @ q, k).tolist()) for q in queries]
+    exact_ms = (time.time() - start) / n_queries * 1000
+
+    results = [{"method": "float32", "bytes": int(matrix.nbytes), "compression": 1.0,
+                "overlap": 1.0, "overlap_rerank": 1.0, "score_ms_per_query": round(exact_ms, 3)}]
+    for method in methods:
+        index = CatalogIndex(dim, capacity=n)
+        for i, v in enumerate(matrix):
+            index.add(i, v)
+        start = time.time()
+        index.compress(quantization.make_quantizer(method, dim))
+        train_s = time.time() - start
+
+        hits = hits_rerank = 0
+        start = time.time()
+        for q, truth in zip(queries, exact):
+            scores = index.scores(q)
+            hits += len(truth.intersection(top_k_indices(scores, k).tolist()))
+        score_ms = (time.time() - start) / n_queries * 1000
+        for q, truth in zip(queries, exact):
+            shortlist = top_k_indices(index.scores(q), max(rerank, k))
+            reranked = shortlist[top_k_indices(matrix[shortlist] @ q, k)]
+            hits_rerank += len(truth.intersection(reranked.tolist()))
+
+        results.append({
+            "method": method,
+            "bytes": int(index.codes.nbytes),
+            "compression": round(matrix.nbytes / index.codes.nbytes, 1),
+            "overlap": round(hits / (n_queries * k), 4),
+            "overlap_rerank": round(hits_rerank / (n_queries * k), 4),
+            "score_ms_per_query": round(score_ms, 3),
+            "train_s": round(train_s, 2),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory vs top-k overlap of quantized catalog scoring.")
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--from-db", action="store_true", help="use the embeddings stored in books.db")
+    parser.add_argument("--methods", default="int8,pq")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=100, help="shortlist size re-ranked with float32")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    args = parser.parse_args()
+
+    matrix = db_catalog() if args.from_db else synthetic_catalog(args.books, args.dim)
+    results = run(matrix, args.methods.split(","), args.k, args.rerank, args.queries)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"📊  {matrix.shape[0]} books x {matrix.shape[1]} dims, top-{args.k}, re-rank shortlist {args.rerank}")
+    print(f"    {'method':<8} {'MB':>9} {'ratio':>6} {'overlap':>8} {'+rerank':>8} {'ms/q':>7}")
+    for r in results:
+        print(f"    {r['method']:<8} {r['bytes'] / 1e6:9.2f} {r['compression']:6.1f} "
+              f"{r['overlap']:8.3f} {r['overlap_rerank']:8.3f} {r['score_ms_per_query']:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
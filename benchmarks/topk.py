@@ -0,0 +1,89 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the current directory to sys.path to make sure we can import app modules
+sys.path.append(os.getcwd())
+
+from app.services import ranking
+
+
+class _Row:
+    """Stand-in for an ORM Book object carried through the old ranking loop."""
+    __slots__ = ("id",)
+
+    def __init__(self, book_id):
+        self.id = book_id
+
+
+def dict_list_sort(scores: np.ndarray, k: int):
+    # The original get_recommendations: one dict per candidate, full sort, slice.
+    recs = [{"book": _Row(i), "score": float(s)} for i, s in enumerate(scores.tolist())]
+    recs.sort(key=lambda x: x["score"], reverse=True)
+    return [r["book"].id for r in recs[:k]]
+
+
+def numpy_full_sort(scores: np.ndarray, k: int):
+    return np.argsort(-scores, kind="stable")[:k]
+
+
+def heap_nlargest(scores: np.ndarray, k: int):
+    return [i for _, i in heapq.nlargest(k, zip(scores.tolist(), range(scores.shape[0])))]
+
+
+def argpartition(scores: np.ndarray, k: int):
+    return ranking.top_k(scores, k)
+
+
+METHODS = {
+    "dict_list_sort": dict_list_sort,
+    "numpy_full_sort": numpy_full_sort,
+    "heap_nlargest": heap_nlargest,
+    "argpartition": argpartition,
+}
+
+
+def time_ms(fn, scores, k, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(scores, k)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of top-k selection strategies vs candidate count.")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5, help="best-of-N timing")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    for n in (int(s) for s in args.sizes.split(",")):
+        scores = rng.standard_normal(n).astype(np.float32)
+        expected = set(ranking.top_k(scores, args.k).tolist())
+        row = {"candidates": n}
+        for name, fn in METHODS.items():
+            assert set(np.asarray(fn(scores, args.k)).tolist()) == expected, name
+            row[name + "_ms"] = round(time_ms(fn, scores, args.k, args.repeat), 4)
+        results.append(row)
+
+    if args.json:
+        print(json.dumps({"k": args.k, "results": results}, indent=2))
+        return
+    print(f"⏱️  top-{args.k} selection, best of {args.repeat} (ms)")
+    print(f"    {'candidates':>10} " + " ".join(f"{name:>16}" for name in METHODS))
+    for row in results:
+        print(f"    {row['candidates']:>10} " + " ".join(f"{row[name + '_ms']:>16.3f}" for name in METHODS))
+
+
+if __name__ == "__main__":
+    main()
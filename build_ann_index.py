@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the current directory to sys.path to make sure we can import app modules
+sys.path.append(os.getcwd())
+
+from app import models, migrations
+from app.database import SessionLocal, engine
+from app.services import catalog_index, ann_index, ranking
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the IVF ANN index used for catalog-scale recommendations.")
+    parser.add_argument("--nlist", type=int, default=None, help="number of clusters (default: sqrt(N))")
+    parser.add_argument("--iters", type=int, default=15, help="k-means iterations")
+    parser.add_argument("--check-recall", action="store_true", help="compare ANN top-k against exact scoring")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled queries for the recall check")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+
+    db = SessionLocal()
+    try:
+        catalog = catalog_index.get_index(db)
+    finally:
+        db.close()
+
+    if catalog is None or catalog.size == 0:
+        print("ℹ️  No book embeddings found. Nothing to index.")
+        return
+
+    start = time.time()
+    print(f"🛠️  Training ANN index over {catalog.size} books (dim={catalog.dim})...")
+    ivf = ann_index.IVFIndex.train(catalog, nlist=args.nlist, n_iter=args.iters)
+    ivf.save(ann_index.ANN_INDEX_PATH)
+    print(f"✅  {ivf.nlist} lists saved to {ann_index.ANN_INDEX_PATH} ({time.time() - start:.2f}s)")
+
+    if args.check_recall:
+        rng = np.random.default_rng(0)
+        n_queries = min(args.queries, catalog.size)
+        queries = catalog.vectors(rng.choice(catalog.size, n_queries, replace=False))
+        print(f"\n📏  Recall@{args.k} vs exact ({n_queries} queries)")
+        for nprobe in sorted({1, 2, 4, 8, 16, 32, ann_index.ANN_NPROBE}):
+            if nprobe > ivf.nlist:
+                continue
+            start = time.time()
+            for q in queries:
+                ivf.search(q, args.k, nprobe)
+            ann_ms = (time.time() - start) / n_queries * 1000
+            recall = ann_index.recall_at_k(ivf, queries, k=args.k, nprobe=nprobe)
+            print(f"    nprobe={nprobe:<3d} recall={recall:.3f}  {ann_ms:.2f} ms/query")
+
+        start = time.time()
+        for q in queries:
+            ranking.top_k_indices(catalog.scores(q), args.k)
+        print(f"    exact       recall=1.000  {(time.time() - start) / n_queries * 1000:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import os
+import sys
+import time
+
+# Add the current directory to sys.path to make sure we can import app modules
+sys.path.append(os.getcwd())
+
+from app import models, migrations
+from app.database import SessionLocal, engine
+from app.services import catalog_index, similar_books
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the book_neighbors table served by /books/{id}/similar.")
+    parser.add_argument("--top-n", type=int, default=similar_books.SIMILAR_TOP_N, help="neighbours stored per book")
+    parser.add_argument("--block", type=int, default=similar_books.SIMILAR_BLOCK_ROWS, help="books scored per matrix product")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+
+    db = SessionLocal()
+    try:
+        catalog = catalog_index.get_index(db)
+        if catalog is None or catalog.size == 0:
+            print("ℹ️  No book embeddings found. Nothing to build.")
+            return
+
+        start = time.time()
+        print(f"🛠️  Computing top-{args.top_n} neighbours for {catalog.size} books (block={args.block})...")
+        written = similar_books.build_table(db, catalog, top_n=args.top_n, block_rows=args.block)
+        print(f"✅  Wrote {written} neighbour rows in {time.time() - start:.2f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
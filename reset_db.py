@@ -7,6 +7,7 @@ sys.path.append(os.getcwd())
 
 from app.database import engine, Base
 from app import models  # Import models to ensure they are registered with Base
+from app.services import embedding_store
 
 def reset_database():
     print("🗑️  Dropping all tables...")
@@ -17,6 +18,11 @@ def reset_database():
     Base.metadata.create_all(bind=engine)
     print("✅  All tables created.")
 
+    # The shared embedding store mirrors books; drop it so workers rebuild from the new DB
+    if os.path.exists(embedding_store.EMBEDDING_STORE_DIR):
+        shutil.rmtree(embedding_store.EMBEDDING_STORE_DIR)
+        print(f"✅  Embedding store removed: {embedding_store.EMBEDDING_STORE_DIR}")
+
 def clear_storage():
     storage_dir = "storage"
     if os.path.exists(storage_dir):
@@ -1,9 +1,28 @@
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pytest
+
+# app.database reads BOOKS_DB_PATH at import time: run against a throwaway DB (and the
+# catalog / ANN files derived from its path) unless one is given explicitly
+os.environ.setdefault("BOOKS_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="books-test-"), "test.db"))
+
 from fastapi.testclient import TestClient
+from app import crud, schemas
+from app.database import SessionLocal
 from app.main import app
-import os
+from app.routers import books as books_router
+from app.services import analysis
 
 client = TestClient(app)
 
+DIM = 16
+
 def test_workflow():
     # 1. Upload Book
     epub_path = r"c:\dev_folder\ssafy\bookspicker-analysis\auto_analysis\input\인간 실격 - 민음사 세계문학전집 103 -- 다자이 오사무 -- ( WeLib.org ).epub"
@@ -19,15 +38,27 @@ def test_workflow():
             files={"file": ("sample.epub", f, "application/epub+zip")}
         )
     
-    if response.status_code != 200:
+    if response.status_code != 202:
         print(f"Upload failed: {response.status_code} {response.text}")
         # Continue testing other parts if possible, but upload is critical
         # return
     else:
-        book_data = response.json()
-        book_id = book_data["id"]
-        print(f"Book uploaded: {book_data['title']} (ID: {book_id})")
-        print(f"Tags: {book_data.get('tags')}")
+        # Analysis runs in the background; poll the job until the book is written
+        job_id = response.json()["id"]
+        print(f"Analysis job queued: {job_id}")
+        while True:
+            job = client.get(f"/jobs/{job_id}").json()
+            if job["status"] in ("succeeded", "failed"):
+                break
+            print(f"  ... {job['status']} ({job['stage']})")
+            time.sleep(2)
+        if job["status"] == "succeeded":
+            book_data = client.get(f"/books/{job['book_id']}").json()
+            book_id = book_data["id"]
+            print(f"Book uploaded: {book_data['title']} (ID: {book_id})")
+            print(f"Tags: {book_data.get('tags')}")
+        else:
+            print(f"Analysis failed: {job['error']}")
 
     # 2. Create User
     print("\nTesting User Creation...")
@@ -79,5 +110,255 @@ def test_workflow():
     else:
         print(f"Recommendations failed: {response.status_code} {response.text}")
 
+def test_profile_vector_dimension_change():
+    # A reduced-dimension book shortens the stored profile sum; the ORM must flush that change
+    import numpy as np
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app import models
+    from app.database import Base
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = models.User(name="Profile User", email="profile@example.com")
+    db.add(user)
+    db.flush()
+    profile = models.UserProfile(user_id=user.id, vector_sum=np.ones(64, dtype=np.float32), weight_sum=1.0, book_count=1)
+    db.add(profile)
+    db.commit()
+
+    assert len(profile.vector_sum) == 64  # Loads the committed value the flush compares against
+    profile.vector_sum = np.full(32, 2.0, dtype=np.float32)
+    db.commit()
+    db.expire_all()
+    assert np.array_equal(db.get(models.UserProfile, user.id).vector_sum, np.full(32, 2.0, dtype=np.float32))
+
+# --- Recommendation / similar / upload API ---
+
+def _unit(direction: int, noise: float = 0.0, seed: int = 0) -> list:
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[direction] = 1.0
+    if noise:
+        vector += noise * np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def _tags(genre: str, violence=None, age=None, fiction="fiction") -> dict:
+    tags = {"primary_genres": {genre: 3}, "is_fiction": {fiction: 3}}
+    if violence is not None:
+        tags["content_warnings"] = {"violence": {violence: 2}}
+    if age is not None:
+        tags["age_rating_estimate"] = {age: 2}
+    return tags
+
+def _create_user(name: str) -> int:
+    response = client.post("/users/", json={"name": name, "email": f"{name}@example.com"})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def _recommended(user_id: int, **params) -> list:
+    response = client.get(f"/users/{user_id}/recommendations", params=params)
+    assert response.status_code == 200, response.text
+    return [item["book_id"] for item in response.json()["items"]]
+
+@pytest.fixture(scope="module")
+def catalog():
+    """
+    A small catalog: a cluster of SF books around direction 0 (with assorted content
+    warnings; "unknown" has none) and romance books spread over the other directions.
+    Returns {title: book id}.
+    """
+    books = {
+        "seed": (_unit(0), _tags("SF", "none", "all")),
+        "calm": (_unit(0, 0.05, 1), _tags("SF", "none", "all")),
+        "gory": (_unit(0, 0.05, 2), _tags("SF", "severe", "19+")),
+        "unknown": (_unit(0, 0.05, 3), _tags("SF")),
+        "essay": (_unit(0, 0.05, 4), _tags("SF", "mild", "12+", fiction="non_fiction")),
+    }
+    for i in range(12):
+        books[f"romance-{i}"] = (_unit(1 + i % 6, 0.3, 10 + i), _tags("로맨스", "none", "all"))
+    db = SessionLocal()
+    try:
+        ids = {}
+        for title, (embedding, tags) in books.items():
+            book = crud.create_book(db, schemas.BookCreate(title=title, author="Test", embedding=embedding, tags=tags))
+            ids[title] = book.id
+        return ids
+    finally:
+        db.close()
+
+@pytest.fixture(scope="module")
+def reader(catalog):
+    """A user who has finished the "seed" book."""
+    user_id = _create_user("reader")
+    client.post(f"/users/{user_id}/books/{catalog['seed']}", json={"status": "finished", "rating": 5})
+    return user_id
+
+def test_recommendation_strategies(catalog, reader):
+    cluster = {catalog[t] for t in ("calm", "gory", "unknown", "essay")}
+    for strategy in ("vector", "tag", "hybrid"):
+        response = client.get(f"/users/{reader}/recommendations", params={"strategy": strategy, "top_k": 4})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["strategy"] == strategy
+        ids = [item["book_id"] for item in body["items"]]
+        assert set(ids) == cluster  # The read book is excluded; the SF neighbours rank first
+        if strategy != "vector":
+            assert "primary_genres:SF" in body["items"][0]["reasons"]["matched_tags"]
+    assert client.get(f"/users/{reader}/recommendations", params={"strategy": "foo"}).status_code == 400
+
+def test_recommendation_facet_filters(catalog, reader):
+    everything = _recommended(reader, strategy="vector", top_k=50)
+    assert {catalog["gory"], catalog["unknown"]} <= set(everything)
+
+    mild = _recommended(reader, strategy="vector", top_k=50, max_violence="mild")
+    assert {catalog["calm"], catalog["essay"]} <= set(mild)
+    assert catalog["gory"] not in mild
+    assert catalog["unknown"] not in mild  # Unknown levels fail safety filters by default
+
+    assert catalog["gory"] not in _recommended(reader, strategy="vector", top_k=50, max_age="15+")
+    assert _recommended(reader, strategy="vector", top_k=50, is_fiction="non_fiction") == [catalog["essay"]]
+    assert client.get(f"/users/{reader}/recommendations", params={"max_violence": "extreme"}).status_code == 400
+
+def test_recommendation_diversify(catalog, reader):
+    plain = _recommended(reader, strategy="vector", top_k=3)
+    assert _recommended(reader, strategy="vector", top_k=3, diversify=1.0) == plain
+
+    # Low λ: after the best match, near-duplicates of it lose to books in other directions
+    cluster = {catalog[t] for t in ("calm", "gory", "unknown", "essay")}
+    diverse = _recommended(reader, strategy="vector", top_k=3, diversify=0.3)
+    assert diverse[0] == plain[0]
+    assert len(cluster & set(diverse)) < len(cluster & set(plain))
+    assert client.get(f"/users/{reader}/recommendations", params={"diversify": 2}).status_code == 422
+
+def test_recommendation_cache_invalidation(catalog):
+    db = SessionLocal()
+    try:
+        anchor = crud.create_book(db, schemas.BookCreate(title="anchor", embedding=_unit(9), tags=_tags("호러"))).id
+        user_id = _create_user("cache")
+        client.post(f"/users/{user_id}/books/{anchor}", json={"status": "finished"})
+        first = _recommended(user_id, strategy="vector", top_k=3)
+        assert _recommended(user_id, strategy="vector", top_k=3) == first  # Served from the cache
+
+        # A shelf write invalidates the user's cached results
+        client.post(f"/users/{user_id}/books/{first[0]}", json={"status": "finished"})
+        assert first[0] not in _recommended(user_id, strategy="vector", top_k=3)
+
+        # So does a new book in the catalog
+        newcomer = crud.create_book(db, schemas.BookCreate(title="newcomer", embedding=_unit(9, 0.01, 99), tags=_tags("호러"))).id
+        assert _recommended(user_id, strategy="vector", top_k=3)[0] == newcomer
+    finally:
+        db.close()
+
+def test_batch_recommendations(catalog, reader):
+    other = _create_user("batch")
+    client.post(f"/users/{other}/books/{catalog['romance-0']}", json={"status": "finished"})
+    newcomer = _create_user("batch-empty")
+
+    response = client.post("/users/recommendations/batch", json={"user_ids": [other, reader, newcomer], "top_k": 3})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["user_id"] for line in lines] == [other, reader, newcomer]
+    for line in lines[:2]:
+        assert [item["book_id"] for item in line["items"]] == _recommended(line["user_id"], strategy="vector", top_k=3)
+    assert lines[2]["items"] == []
+    assert client.post("/users/recommendations/batch", json={"top_k": 3}).status_code == 400
+
+def test_similar_books(catalog):
+    response = client.get(f"/books/{catalog['calm']}/similar", params={"k": 4})
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert {item["book_id"] for item in items} == {catalog[t] for t in ("seed", "gory", "unknown", "essay")}
+    assert [item["score"] for item in items] == sorted((item["score"] for item in items), reverse=True)
+    assert client.get("/books/999999/similar").status_code == 404
+    assert client.get(f"/books/{catalog['calm']}/similar", params={"k": 0}).status_code == 422
+
+def _epub_bytes(text: str = "chapter", mimetype_compression=zipfile.ZIP_STORED) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=mimetype_compression)
+        archive.writestr("OEBPS/chapter.xhtml", f"<html><body><p>{text}</p></body></html>", compress_type=zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+def _upload(content: bytes, title: str = "Uploaded", **form):
+    return client.post(
+        "/books/upload",
+        data={"title": title, "author": "Test", **form},
+        files={"file": ("book.epub", content, "application/epub+zip")},
+    )
+
+def _wait_for_job(job_id: str) -> dict:
+    for _ in range(100):
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_upload_dedup(catalog, monkeypatch, tmp_path):
+    analysed = []
+
+    def fake_analyze(path, progress=None):
+        analysed.append(path)
+        return {"description": "d", "tags": _tags("SF", "none", "all"), "embedding": _unit(0, 0.05, 50)}
+
+    monkeypatch.setattr(analysis, "analyze_epub", fake_analyze)
+    monkeypatch.setattr(books_router, "UPLOAD_DIR", str(tmp_path))
+    content = _epub_bytes("dedup")
+
+    response = _upload(content)
+    assert response.status_code == 202
+    job = _wait_for_job(response.json()["id"])
+    assert job["status"] == "succeeded"
+    book_id = job["book_id"]
+
+    # Same file again: no second analysis, the job points at the analysed book
+    response = _upload(content, title="Again")
+    assert response.status_code == 200
+    assert response.json()["book_id"] == book_id
+    assert len(analysed) == 1
+
+    # on_duplicate=reuse: a new book with this title and the analysed tags
+    response = _upload(content, title="Renamed", on_duplicate="reuse")
+    assert response.status_code == 200
+    reused = client.get(f"/books/{response.json()['book_id']}").json()
+    assert reused["id"] != book_id and reused["title"] == "Renamed"
+    assert reused["tags"] == client.get(f"/books/{book_id}").json()["tags"]
+    assert len(analysed) == 1
+
+    assert _upload(content, on_duplicate="bogus").status_code == 400
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(analysed[0])]  # Duplicates are not kept
+
+def test_upload_rejects_invalid_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(books_router, "UPLOAD_DIR", str(tmp_path))
+    assert _upload(b"not a zip archive").status_code == 400
+    assert _upload(_epub_bytes(mimetype_compression=zipfile.ZIP_DEFLATED)).status_code == 400
+    response = client.post("/books/upload", data={"title": "T"}, files={"file": ("book.txt", b"x", "text/plain")})
+    assert response.status_code == 400
+    assert os.listdir(tmp_path) == []
+
+def test_upload_size_limit(monkeypatch, tmp_path):
+    monkeypatch.setattr(books_router, "MAX_UPLOAD_BYTES", 4096)
+    monkeypatch.setattr(books_router, "UPLOAD_DIR", str(tmp_path))
+    assert _upload(_epub_bytes(os.urandom(8192).hex())).status_code == 413  # Declared Content-Length
+
+    # Chunked body without a Content-Length: counted as it streams
+    boundary = "test-boundary"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nT\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"book.epub\"\r\n"
+        f"Content-Type: application/epub+zip\r\n\r\n"
+    ).encode() + os.urandom(16384) + f"\r\n--{boundary}--\r\n".encode()
+
+    def chunks():
+        for start in range(0, len(body), 1024):
+            yield body[start:start + 1024]
+
+    response = client.post("/books/upload", content=chunks(),
+                           headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+    assert os.listdir(tmp_path) == []
+
 if __name__ == "__main__":
     test_workflow()